@@ -0,0 +1,182 @@
+# analytics.py - Vectorized cohort analytics for teacher and parent dashboards
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+import numpy as np
+from utils import ProgressTracker
+
+logger = logging.getLogger(__name__)
+
+# Quizzes compared at each end of the history to classify the trend
+TREND_WINDOW = 3
+DIFFICULTY_SCORE = 70
+STRENGTH_SCORE = 80
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class CohortAnalytics:
+    """Columnar per-student quiz aggregates for a whole class
+
+    Histories are loaded once into NumPy columns; afterwards ``sync`` and
+    ``add_score`` only fold in new scores, so dashboard queries stay a single
+    vectorized pass over per-student aggregates.
+    """
+
+    def __init__(self):
+        self.student_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self._allocate(0)
+
+    def _allocate(self, size: int) -> None:
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.sums = np.zeros(size)
+        self.sum_sq = np.zeros(size)
+        self.first_sums = np.zeros(size)
+        self.last_scores = np.full((size, TREND_WINDOW), np.nan)
+        self.low_counts = np.zeros(size, dtype=np.int64)
+        self.high_counts = np.zeros(size, dtype=np.int64)
+        self.min_scores = np.full(size, np.inf)
+        self.max_scores = np.full(size, -np.inf)
+        self.last_study_day = np.zeros(size, dtype=np.int64)
+        self.last_day_run = np.zeros(size, dtype=np.int64)
+
+    def load(self, trackers: Dict[str, ProgressTracker]) -> None:
+        """Rebuild all columns from the trackers' quiz and session histories"""
+        self.student_ids = sorted(trackers)
+        self.positions = {student_id: index for index, student_id in enumerate(self.student_ids)}
+        size = len(self.student_ids)
+        self._allocate(size)
+        if not size:
+            return
+
+        histories = [trackers[student_id].quiz_history for student_id in self.student_ids]
+        counts = np.fromiter((len(history) for history in histories), dtype=np.int64, count=size)
+        # Zero-copy views over each history's array('d') before the single concatenation
+        scores = np.concatenate([np.frombuffer(history.scores, dtype=np.float64) for history in histories])
+
+        owner = np.repeat(np.arange(size), counts)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        rank = np.arange(len(scores)) - offsets[owner]
+
+        self.counts = counts
+        self.sums = np.bincount(owner, weights=scores, minlength=size)
+        self.sum_sq = np.bincount(owner, weights=scores * scores, minlength=size)
+        self.low_counts = np.bincount(owner[scores < DIFFICULTY_SCORE], minlength=size)
+        self.high_counts = np.bincount(owner[scores >= STRENGTH_SCORE], minlength=size)
+        np.minimum.at(self.min_scores, owner, scores)
+        np.maximum.at(self.max_scores, owner, scores)
+
+        first = rank < TREND_WINDOW
+        self.first_sums = np.bincount(owner[first], weights=scores[first], minlength=size)
+        last = rank >= counts[owner] - TREND_WINDOW
+        self.last_scores[owner[last], rank[last] % TREND_WINDOW] = scores[last]
+
+        for index, student_id in enumerate(self.student_ids):
+            self._load_sessions(index, trackers[student_id])
+
+    def _load_sessions(self, index: int, tracker: ProgressTracker) -> None:
+        sessions = tracker.study_sessions
+        self.last_study_day[index] = sessions.study_days[-1] if sessions.study_days else 0
+        self.last_day_run[index] = sessions.last_day_run
+
+    def sync(self, trackers: Dict[str, ProgressTracker]) -> None:
+        """Fold in scores recorded since the last load or sync"""
+        if len(trackers) != len(self.positions) or any(student_id not in self.positions for student_id in trackers):
+            self.load(trackers)
+            return
+
+        for student_id, tracker in trackers.items():
+            index = self.positions[student_id]
+            history = tracker.quiz_history
+            for position in range(int(self.counts[index]), len(history)):
+                self._add(index, history.scores[position])
+            self._load_sessions(index, tracker)
+
+    def add_score(self, student_id: str, score: float) -> None:
+        """Record a new score for a student already in the cohort"""
+        self._add(self.positions[student_id], float(score))
+
+    def _add(self, index: int, score: float) -> None:
+        count = int(self.counts[index])
+        if count < TREND_WINDOW:
+            self.first_sums[index] += score
+        self.last_scores[index, count % TREND_WINDOW] = score
+        self.counts[index] = count + 1
+        self.sums[index] += score
+        self.sum_sq[index] += score * score
+        self.low_counts[index] += score < DIFFICULTY_SCORE
+        self.high_counts[index] += score >= STRENGTH_SCORE
+        self.min_scores[index] = min(self.min_scores[index], score)
+        self.max_scores[index] = max(self.max_scores[index], score)
+
+    def _metrics(self, today: Optional[int] = None) -> Dict[str, np.ndarray]:
+        counts = self.counts
+        safe_counts = np.maximum(counts, 1)
+        mean = self.sums / safe_counts
+        variance = np.maximum(self.sum_sq / safe_counts - mean * mean, 0.0)
+        consistency = np.where(counts >= 2, np.clip(100 - variance / 10, 0, 100), 0.0)
+
+        first_mean = self.first_sums / np.maximum(np.minimum(counts, TREND_WINDOW), 1)
+        recent = ~np.isnan(self.last_scores)
+        last_mean = np.where(recent, self.last_scores, 0.0).sum(axis=1) / np.maximum(recent.sum(axis=1), 1)
+        trend = np.where(counts < TREND_WINDOW, 'insufficient_data',
+                         np.where(last_mean > first_mean + 5, 'improving',
+                                  np.where(last_mean < first_mean - 5, 'declining', 'stable')))
+
+        today = today if today is not None else datetime.now().date().toordinal()
+        streak = np.where((self.last_study_day > 0) & (today - self.last_study_day <= 1), self.last_day_run, 0)
+
+        return {
+            'mean': mean,
+            'variance': variance,
+            'consistency': consistency,
+            'trend': trend,
+            'streak': streak,
+            'difficulty': (counts > 0) & (self.low_counts > counts * 0.5),
+            'strength': (counts > 0) & (self.high_counts > counts * 0.7)
+        }
+
+    def student_metrics(self) -> List[Dict[str, Any]]:
+        """Per-student metrics for every student in the cohort"""
+        metrics = self._metrics()
+        columns = {
+            'student_id': self.student_ids,
+            'total_quizzes': self.counts.tolist(),
+            'average_score': np.round(metrics['mean'], 2).tolist(),
+            'highest_score': np.where(self.counts > 0, self.max_scores, 0.0).tolist(),
+            'lowest_score': np.where(self.counts > 0, self.min_scores, 0.0).tolist(),
+            'variance': np.round(metrics['variance'], 2).tolist(),
+            'consistency_score': np.round(metrics['consistency'], 2).tolist(),
+            'improvement_trend': metrics['trend'].tolist(),
+            'study_streak': metrics['streak'].tolist(),
+            'needs_support': metrics['difficulty'].tolist(),
+            'strong_performer': metrics['strength'].tolist()
+        }
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def class_summary(self) -> Dict[str, Any]:
+        """Class-level distributions over students who have taken at least one quiz"""
+        metrics = self._metrics()
+        active = self.counts > 0
+        means = metrics['mean'][active]
+        if not means.size:
+            return {'students': len(self.student_ids), 'active_students': 0,
+                    'message': 'No quiz data available for analytics'}
+
+        histogram, edges = np.histogram(means, bins=10, range=(0, 100))
+        trends, trend_counts = np.unique(metrics['trend'][active], return_counts=True)
+        return {
+            'students': len(self.student_ids),
+            'active_students': int(active.sum()),
+            'total_quizzes': int(self.counts.sum()),
+            'average_score': round(float(self.sums.sum() / self.counts.sum()), 2),
+            'score_percentiles': dict(zip(
+                (f"p{p}" for p in PERCENTILES), np.round(np.percentile(means, PERCENTILES), 2).tolist()
+            )),
+            'score_distribution': {f"{int(edges[i])}-{int(edges[i + 1])}": int(histogram[i])
+                                   for i in range(len(histogram))},
+            'trend_counts': dict(zip(trends.tolist(), trend_counts.tolist())),
+            'needs_support': int(metrics['difficulty'].sum()),
+            'strong_performers': int(metrics['strength'].sum()),
+            'average_streak': round(float(metrics['streak'].mean()), 2)
+        }
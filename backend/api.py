@@ -3,10 +3,17 @@ import sys
 import os
 import io
 import base64
+import threading
+import time
+import uuid
+import random
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from diffusers import StableDiffusionPipeline
+from diffusers import StableDiffusionImg2ImgPipeline
 import torch
+import torch.nn.functional as F
+from inference_backend import load_pipeline, supports_prompt_embeds
 
 # Optional helper to download from Hugging Face if model folder missing
 from huggingface_hub import snapshot_download
@@ -15,6 +22,15 @@ MODEL_PATH = "./stable-diffusion-v1-4"
 # Set HF_REPO_ID env var to your HF repo (e.g. "CompVis/stable-diffusion-v1-4" or "youruser/your-model")
 HF_REPO_ID = os.getenv("HF_REPO_ID", "CompVis/stable-diffusion-v1-4")
 HF_TOKEN = os.getenv("HF_TOKEN", None)  # required for private model repos
+# Number of prompt embeddings kept in memory (each is ~230 KB in float32)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "256"))
+# Progressive mode defaults: a small, few-step draft refined into the final image
+DRAFT_SIZE = 256
+DRAFT_STEPS = 8
+FINAL_SIZE = 512
+FINAL_STEPS = 25
+REFINE_STRENGTH = 0.6
+MAX_PROGRESSIVE_JOBS = 100
 
 def ensure_model():
     """Download model from HF if MODEL_PATH is missing or empty."""
@@ -36,15 +52,183 @@ ensure_model()
 
 try:
     dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-    # Use local_files_only=True to avoid trying to fetch from HF at load time
-    pipe = StableDiffusionPipeline.from_pretrained(MODEL_PATH, torch_dtype=dtype, local_files_only=True)
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    pipe = pipe.to(device)
+    # Backend is chosen with INFERENCE_BACKEND / INFERENCE_QUANTIZE (see inference_backend.py)
+    pipe = load_pipeline(MODEL_PATH, device=device, dtype=dtype)
     print(f"✅ Model loaded successfully on {device}.", file=sys.stderr)
 except Exception as e:
     print(f"❌ Error loading model: {e}", file=sys.stderr)
     sys.exit(1)
 
+class PromptEmbeddingCache:
+    """Bounded LRU of CLIP text embeddings keyed by prompt text."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.encode_ms_total = 0.0
+
+    def get(self, prompt):
+        with self.lock:
+            embeds = self.entries.get(prompt)
+            if embeds is not None:
+                self.entries.move_to_end(prompt)
+                self.hits += 1
+                return embeds
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            embeds, _ = pipe.encode_prompt(prompt, device, 1, do_classifier_free_guidance=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self.lock:
+            self.misses += 1
+            self.encode_ms_total += elapsed_ms
+            self.entries[prompt] = embeds
+            self.entries.move_to_end(prompt)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return embeds
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            avg_encode_ms = self.encode_ms_total / self.misses if self.misses else 0.0
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_encode_ms': round(avg_encode_ms, 2),
+                'saved_ms': round(self.hits * avg_encode_ms, 2),
+            }
+
+embedding_cache = PromptEmbeddingCache(EMBED_CACHE_SIZE)
+
+# Embedding reuse and draft refinement need a PyTorch pipeline; ONNX backends take plain prompts
+USE_PROMPT_EMBEDS = supports_prompt_embeds(pipe)
+
+# The refiner shares weights with the main pipeline but keeps its own scheduler,
+# so a draft can run while another request's refinement is in progress.
+refine_pipe = StableDiffusionImg2ImgPipeline(
+    **{**pipe.components, 'scheduler': pipe.scheduler.__class__.from_config(pipe.scheduler.config)}
+) if USE_PROMPT_EMBEDS else None
+pipe_lock = threading.Lock()
+refine_lock = threading.Lock()
+
+progressive_jobs = OrderedDict()
+jobs_lock = threading.Lock()
+
+def image_to_base64(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    buffer.seek(0)
+    return base64.b64encode(buffer.read()).decode("utf-8")
+
+def is_flagged(output):
+    """Whether the pipeline's safety checker flagged the first image of an output."""
+    flags = getattr(output, 'nsfw_content_detected', None)
+    return bool(flags and flags[0])
+
+def decode_latents(latents):
+    """Decode latents through the VAE and the pipeline's safety checker."""
+    with torch.inference_mode():
+        decoded = pipe.vae.decode(latents / pipe.vae.config.scaling_factor).sample
+        decoded, flags = pipe.run_safety_checker(decoded, device, decoded.dtype)
+    do_denormalize = [not flag for flag in flags] if flags is not None else None
+    image = pipe.image_processor.postprocess(decoded, output_type="pil", do_denormalize=do_denormalize)[0]
+    return image, bool(flags and flags[0])
+
+def progressive_params(data):
+    """Parse progressive mode options, raising ValueError for invalid values."""
+    params = {
+        'draft_size': int(data.get('draft_size', DRAFT_SIZE)),
+        'draft_steps': int(data.get('draft_steps', DRAFT_STEPS)),
+        'final_size': int(data.get('size', FINAL_SIZE)),
+        'final_steps': int(data.get('steps', FINAL_STEPS)),
+        'strength': float(data.get('refine_strength', REFINE_STRENGTH)),
+        'seed': int(data.get('seed', random.randint(0, 2**31 - 1))),
+    }
+    for name in ('draft_size', 'final_size'):
+        if params[name] <= 0 or params[name] % 8:
+            raise ValueError(f"{name} must be a positive multiple of 8")
+    if params['draft_steps'] < 1 or params['final_steps'] < 1:
+        raise ValueError("steps must be at least 1")
+    if not 0 < params['strength'] <= 1:
+        raise ValueError("refine_strength must be in (0, 1]")
+    return params
+
+def set_job(job_id, **fields):
+    with jobs_lock:
+        progressive_jobs.setdefault(job_id, {}).update(fields)
+        while len(progressive_jobs) > MAX_PROGRESSIVE_JOBS:
+            progressive_jobs.popitem(last=False)
+
+def refine_draft(job_id, draft_latents, prompt_embeds, negative_prompt_embeds, seed, size, steps, strength):
+    """Upscale the draft latents and denoise them into the final image."""
+    try:
+        latents = F.interpolate(draft_latents, size=(size // 8, size // 8), mode="bicubic")
+        generator = torch.Generator(device=device).manual_seed(seed)
+        with refine_lock:
+            output = refine_pipe(
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                image=latents,
+                strength=strength,
+                num_inference_steps=steps,
+                generator=generator,
+            )
+        if is_flagged(output):
+            print(f"⚠️ Final image for job {job_id} flagged by safety checker.", file=sys.stderr)
+            set_job(job_id, status='error', error='Generated image was flagged as unsafe.')
+            return
+        set_job(job_id, status='done', image_base64=image_to_base64(output.images[0]))
+        print(f"✅ Final image ready for job {job_id}.", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ Error refining job {job_id}: {e}", file=sys.stderr)
+        set_job(job_id, status='error', error='Failed to generate final image.')
+
+def generate_progressive(data, prompt_embeds, negative_prompt_embeds):
+    """Return a fast low-resolution draft and refine it in the background."""
+    try:
+        params = progressive_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid progressive options: {e}'}), 400
+    seed = params['seed']
+
+    generator = torch.Generator(device=device).manual_seed(seed)
+    with pipe_lock:
+        draft_latents = pipe(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_prompt_embeds,
+            height=params['draft_size'],
+            width=params['draft_size'],
+            num_inference_steps=params['draft_steps'],
+            generator=generator,
+            output_type="latent",
+        ).images
+    # Latent output bypasses the pipeline's safety checker, so decoding runs it explicitly
+    draft_image, flagged = decode_latents(draft_latents)
+    if flagged:
+        print("⚠️ Draft image flagged by safety checker.", file=sys.stderr)
+        return jsonify({'error': 'Generated image was flagged as unsafe.'}), 400
+
+    job_id = uuid.uuid4().hex
+    set_job(job_id, status='pending', seed=seed)
+    threading.Thread(
+        target=refine_draft,
+        args=(job_id, draft_latents, prompt_embeds, negative_prompt_embeds, seed,
+              params['final_size'], params['final_steps'], params['strength']),
+        daemon=True,
+    ).start()
+
+    print(f"✅ Draft generated, refining as job {job_id}.", file=sys.stderr)
+    return jsonify({'draft_base64': image_to_base64(draft_image), 'job_id': job_id, 'seed': seed})
+
 # --- Flask App ---
 app = Flask(__name__)
 CORS(app)
@@ -53,19 +237,37 @@ CORS(app)
 def generate():
     data = request.get_json()
     prompt = data.get('prompt')
+    negative_prompt = data.get('negative_prompt') or ""
 
     if not prompt:
         return jsonify({'error': 'Prompt is required.'}), 400
 
     try:
         print("🎨 Generating image...", file=sys.stderr)
-        image = pipe(prompt, num_inference_steps=25).images[0]
+        if not USE_PROMPT_EMBEDS:
+            if data.get('progressive'):
+                return jsonify({'error': 'Progressive mode requires a PyTorch inference backend.'}), 400
+            with pipe_lock:
+                image = pipe(prompt, negative_prompt=negative_prompt or None, num_inference_steps=25).images[0]
+            print("✅ Image generated successfully.", file=sys.stderr)
+            return jsonify({'image_base64': image_to_base64(image)})
+
+        # Text embeddings (including the empty prompt used for guidance) come from the cache
+        prompt_embeds = embedding_cache.get(prompt)
+        negative_prompt_embeds = embedding_cache.get(negative_prompt)
+
+        if data.get('progressive'):
+            return generate_progressive(data, prompt_embeds, negative_prompt_embeds)
+
+        with pipe_lock:
+            image = pipe(
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                num_inference_steps=25,
+            ).images[0]
 
         # Convert to Base64
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        img_base64 = base64.b64encode(buffer.read()).decode("utf-8")
+        img_base64 = image_to_base64(image)
 
         print("✅ Image generated successfully.", file=sys.stderr)
         return jsonify({'image_base64': img_base64})
@@ -74,5 +276,19 @@ def generate():
         print(f"❌ Error generating image: {e}", file=sys.stderr)
         return jsonify({'error': 'Failed to generate image.'}), 500
 
+@app.route('/generate/<job_id>', methods=['GET'])
+def generate_status(job_id):
+    with jobs_lock:
+        job = progressive_jobs.get(job_id)
+        job = dict(job) if job else None
+
+    if not job:
+        return jsonify({'error': 'Unknown job.'}), 404
+    return jsonify({'job_id': job_id, **job})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(embedding_cache.stats())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002)
@@ -0,0 +1,61 @@
+# bench_import.py - Measures cold import time of the backend modules
+#
+# Usage: python bench_import.py [module ...] --runs 5
+#
+# Each run imports the module in a fresh interpreter; the slowest imports from
+# the last run's `-X importtime` report are listed to spot regressions.
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_import(module):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return elapsed, result.stderr
+
+
+def slowest_imports(report, limit):
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold import time of backend modules.")
+    parser.add_argument("modules", nargs="*", default=["controller", "model", "utils"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline, _ = time_import("json")
+    print(f"Interpreter startup baseline: {baseline * 1000:.1f} ms")
+
+    for module in args.modules:
+        timings = []
+        report = ""
+        for _ in range(args.runs):
+            elapsed, report = time_import(module)
+            timings.append(elapsed)
+
+        median = statistics.median(timings)
+        print(f"\nimport {module}: median {median * 1000:.1f} ms "
+              f"({(median - baseline) * 1000:.1f} ms above baseline, {args.runs} runs)")
+        for cumulative_us, name in slowest_imports(report, args.top):
+            print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# compare_backends.py - Latency/accuracy comparison of inference backends
+#
+# Usage: python compare_backends.py --backends torch,compile,onnx --int8 --runs 3
+#
+# Every backend starts from the same initial latents, so the images can be
+# compared pixel-wise against the eager PyTorch reference.
+import argparse
+import gc
+import sys
+import time
+import numpy as np
+import torch
+from inference_backend import BACKENDS, load_pipeline, supports_prompt_embeds
+
+MODEL_PATH = "./stable-diffusion-v1-4"
+DEFAULT_PROMPT = "a colorful illustration of the solar system for a school science lesson"
+
+
+def initial_latents(seed, size):
+    rng = np.random.RandomState(seed)
+    return rng.standard_normal((1, 4, size // 8, size // 8)).astype(np.float32)
+
+
+def run_pipeline(pipe, prompt, latents, steps, size):
+    # ONNX pipelines take numpy latents, PyTorch pipelines take tensors
+    latents = torch.from_numpy(latents) if supports_prompt_embeds(pipe) else latents
+    image = pipe(prompt, num_inference_steps=steps, height=size, width=size, latents=latents).images[0]
+    return np.asarray(image, dtype=np.float32)
+
+
+def psnr(reference, image):
+    mse = np.mean((reference - image) ** 2)
+    return float("inf") if mse == 0 else 20 * np.log10(255.0) - 10 * np.log10(mse)
+
+
+def benchmark(backend, quantize, args, latents):
+    start = time.perf_counter()
+    pipe = load_pipeline(MODEL_PATH, backend=backend, quantize=quantize, device="cpu")
+    load_s = time.perf_counter() - start
+
+    # Warm-up run also triggers compilation for the torch.compile backend
+    start = time.perf_counter()
+    image = run_pipeline(pipe, args.prompt, latents, args.steps, args.size)
+    warmup_s = time.perf_counter() - start
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        image = run_pipeline(pipe, args.prompt, latents, args.steps, args.size)
+        timings.append(time.perf_counter() - start)
+
+    del pipe
+    gc.collect()
+    return {
+        'load_s': load_s,
+        'warmup_s': warmup_s,
+        'median_s': float(np.median(timings)),
+        'image': image,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Stable Diffusion inference backends on this host.")
+    parser.add_argument("--backends", default="torch,onnx", help=f"Comma-separated list from: {', '.join(BACKENDS)}")
+    parser.add_argument("--int8", action="store_true", help="Also benchmark int8 dynamic quantization")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--steps", type=int, default=25)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    latents = initial_latents(args.seed, args.size)
+    configs = [("torch", False)]
+    for backend in args.backends.split(","):
+        backend = backend.strip().lower()
+        if backend != "torch":
+            configs.append((backend, False))
+        if args.int8 and backend in ("torch", "compile", "onnx"):
+            configs.append((backend, True))
+
+    results = []
+    reference = None
+    for backend, quantize in configs:
+        label = f"{backend}{'+int8' if quantize else ''}"
+        print(f"Benchmarking {label}...", file=sys.stderr)
+        try:
+            result = benchmark(backend, quantize, args, latents)
+        except Exception as e:
+            print(f"Skipping {label}: {e}", file=sys.stderr)
+            continue
+
+        if reference is None:
+            reference = result['image']
+        results.append((label, result, psnr(reference, result['image']),
+                        float(np.mean(np.abs(reference - result['image'])))))
+
+    baseline = results[0][1]['median_s'] if results else None
+    print(f"{'backend':<16}{'load s':>9}{'warmup s':>10}{'median s':>10}{'speedup':>9}{'PSNR dB':>9}{'MAE':>8}")
+    for label, result, result_psnr, mae in results:
+        print(f"{label:<16}{result['load_s']:>9.1f}{result['warmup_s']:>10.1f}{result['median_s']:>10.2f}"
+              f"{baseline / result['median_s']:>8.2f}x{result_psnr:>9.1f}{mae:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
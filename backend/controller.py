@@ -1,22 +1,81 @@
 # controller.py - Enhanced Business Logic Controller
 from model import StudentModel
-from utils import FileProcessor, DataValidator, ProgressTracker
+from utils import FileProcessor, DataValidator, ProgressTracker, QuizHistory, PlanParser
+from ingest import ChunkStore, ingest_file, iter_chunks
+import os
 import logging
-from typing import Dict, List, Optional, Any
+import json
+import hashlib
+import zlib
+import threading
+from typing import Dict, List, Optional, Any, Sequence, Iterable, Iterator
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
 
 logger = logging.getLogger(__name__)
 
+# Days generated ahead of the one a student opens in lazy plan mode
+PLAN_PREFETCH_DAYS = 2
+
+# Shared pool for on-demand day generation across students
+_plan_day_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='plan-day')
+
+# Characters read from ingested materials for each kind of prompt
+MATERIAL_CONTEXT_CHARS = {'answers': 1500, 'quiz': 20000}
+
+def _lower_thread_priority() -> None:
+    """Runs prefetch workers at a lower scheduling priority where the OS supports it"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+# Small low-priority pool for speculative work after plan creation
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch',
+                                        initializer=_lower_thread_priority)
+# Chunked plan audio is slow, so it gets its own pool and never delays the quiz prefetch
+_audio_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch-audio',
+                                              initializer=_lower_thread_priority)
+
+# Longest text sent to text-to-speech in one request
+TTS_CHUNK_CHARS = 1000
+
+# Number of upcoming plan days rewritten after a quiz, by minimum score
+ADAPTATION_WINDOWS = ((90, 2), (80, 3), (0, 5))
+
+# Fields written for each student in streaming exports unless a selection is given.
+# The plan body is opt-in because it dominates the record size.
+DEFAULT_EXPORT_FIELDS = (
+    'class_standard', 'subject', 'learning_style', 'days', 'plan_created_date',
+    'plan_version', 'last_adaptation_date', 'total_quizzes', 'average_score',
+    'study_streak', 'last_study_session'
+)
+
 class StudentController:
     def __init__(self, model: StudentModel):
         self.model = model
         self.file_processor = FileProcessor()
         self.validator = DataValidator()
-        self.progress_tracker = ProgressTracker()
+        self.plan_parser = PlanParser()
+        self.progress_tracker = ProgressTracker(self._get_quiz_history())
+        self.class_students: Dict[str, 'StudentController'] = {}
+        # Built on first use so NumPy is only imported for dashboards
+        self.cohort_analytics = None
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_cancel = threading.Event()
+        self._prefetch_futures: Dict[str, tuple] = {}
+        self._plan_lock = threading.Lock()
+        self._plan_day_futures: Dict[int, Future] = {}
 
     def create_and_get_plan(self, syllabus: str, days: int, learning_style: str, 
-                           class_standard: str = 'Grade 8', subject: str = '') -> str:
-        """Orchestrates plan generation with validation and storage"""
+                           class_standard: str = 'Grade 8', subject: str = '', lazy: bool = False,
+                           prefetch: bool = True) -> str:
+        """Orchestrates plan generation with validation and storage
+
+        With ``lazy`` only a week-by-week outline is generated up front; daily
+        content is generated when a day is opened via ``get_plan_day``. With
+        ``prefetch`` the quiz, videos and plan audio are prepared in the background.
+        """
         try:
             # Validate inputs
             validation_result = self.validator.validate_plan_inputs(
@@ -26,6 +85,15 @@ class StudentController:
             if not validation_result['is_valid']:
                 return f"Validation Error: {validation_result['message']}"
 
+            # Serve the last known good plan for the same inputs while the model is failing fast
+            plan_key = self._request_key(syllabus, days, learning_style, class_standard, subject)
+            if self.model.is_circuit_open():
+                last_plan = self.model.get_data('current_plan')
+                if last_plan and self.model.get_data('current_plan_key') == plan_key:
+                    logger.warning("Model circuit open, serving last known good plan")
+                    return last_plan
+                return "Error: Study plan service is temporarily unavailable. Please try again later."
+
             # Store initial inputs
             self.model.set_data('syllabus', syllabus)
             self.model.set_data('days', days)
@@ -34,14 +102,34 @@ class StudentController:
             self.model.set_data('subject', subject)
             self.model.set_data('plan_created_date', datetime.now().isoformat())
 
-            # Generate the plan
-            plan = self.model.generate_plan(syllabus, days, learning_style, class_standard, subject)
+            outline = None
+            if lazy:
+                outline = self.model.generate_plan_outline(syllabus, days, learning_style, class_standard, subject)
+
+            # Generate the plan, or render the outline when running lazily
+            if outline:
+                plan = self._render_plan_outline(outline, days, subject, learning_style)
+            else:
+                plan = self.model.generate_plan(syllabus, days, learning_style, class_standard, subject)
+
+            if plan is None:
+                # The generic plan is only shown; the last good plan and its key stay stored
+                logger.error("Plan generation failed, returning fallback plan")
+                return self.model.generate_fallback_plan(days, subject, learning_style)
             
             if plan and not plan.startswith("Error:"):
-                self.model.set_data('current_plan', plan)
+                self._store_plan(plan, outline)
+                self.model.set_data('current_plan_key', plan_key)
                 
                 # Initialize progress tracking
                 self.progress_tracker.initialize_plan_tracking(days)
+
+                if outline:
+                    for day in range(1, min(days, PLAN_PREFETCH_DAYS) + 1):
+                        self._ensure_plan_day(day)
+
+                if prefetch:
+                    self.start_prefetch()
                 
                 logger.info(f"Study plan created successfully for {subject} - {class_standard}")
                 return plan
@@ -53,6 +141,366 @@ class StudentController:
             logger.error(f"Error in create_and_get_plan: {str(e)}")
             return f"Error creating study plan: {str(e)}"
 
+    def start_prefetch(self) -> None:
+        """Speculatively prepares the quiz, videos and plan audio a student usually asks for next
+
+        Plan audio is skipped for lazy plans, whose text changes as days are generated.
+        """
+        self.cancel_prefetch()
+        cancel_event = threading.Event()
+        subject = self.model.get_data('subject') or ''
+        quiz_text = (self.model.get_data('textbook_text') or
+                     self._read_material('textbook', MATERIAL_CONTEXT_CHARS['quiz']) or
+                     self.model.get_data('syllabus') or '')
+        quiz_key = (self.file_processor.extract_key_concepts(quiz_text), subject, 5)
+        plan_key = self._plan_audio_key()
+
+        with self._prefetch_lock:
+            self._prefetch_cancel = cancel_event
+            self._prefetch_futures = {
+                'quiz': (quiz_key, _prefetch_executor.submit(self._prefetch_quiz, quiz_key, cancel_event)),
+                'videos': (subject, _prefetch_executor.submit(self._prefetch_videos, subject, cancel_event))
+            }
+            # Lazy plans change with every generated day, so audio of the outline would go stale at once
+            if not self.model.get_data('plan_outline'):
+                self._prefetch_futures['audio'] = (
+                    plan_key, _audio_prefetch_executor.submit(self._prefetch_audio, plan_key, cancel_event)
+                )
+        logger.info(f"Started background prefetch for {subject}")
+
+    def cancel_prefetch(self) -> None:
+        """Stops outstanding prefetch work, e.g. when the student navigates away"""
+        with self._prefetch_lock:
+            self._prefetch_cancel.set()
+            for _, future in self._prefetch_futures.values():
+                future.cancel()
+            self._prefetch_futures = {}
+
+    def _pending_prefetch(self, name: str, key: Any) -> bool:
+        """Waits for a prefetch of the same request that has already started
+
+        A prefetch still queued behind other speculative work is cancelled so the
+        caller can do the work inline instead of waiting for the queue to drain.
+        """
+        with self._prefetch_lock:
+            pending = self._prefetch_futures.get(name)
+        if not pending or pending[0] != key:
+            return False
+
+        future = pending[1]
+        if not (future.running() or future.done()) and future.cancel():
+            return False
+        if future.cancelled():
+            return False
+        # A failed prefetch leaves the cache empty, so the caller falls back to inline work
+        future.exception()
+        return True
+
+    def _prefetch_quiz(self, quiz_key: tuple, cancel_event: threading.Event) -> None:
+        processed_text, subject, num_questions = quiz_key
+        if cancel_event.is_set() or not processed_text:
+            return
+        questions = self.model.generate_quiz(processed_text, subject, num_questions)
+        if questions and not cancel_event.is_set():
+            self.model.set_data('prefetched_quiz', {'key': quiz_key, 'questions': questions})
+
+    def _prefetch_videos(self, subject: str, cancel_event: threading.Event) -> None:
+        if not subject or cancel_event.is_set():
+            return
+        videos = self.model.get_youtube_videos(subject, 5)
+        if videos and not cancel_event.is_set():
+            # Populates the regular YouTube cache used by get_youtube_videos
+            cache_key = f"youtube_{subject.lower().replace(' ', '_')}"
+            self.model.set_data(cache_key, videos)
+            self.model.set_data(f"{cache_key}_timestamp", datetime.now().isoformat())
+
+    def _request_key(self, *parts: Any) -> str:
+        """Hashes the inputs of a request so cached results are only served for the same request"""
+        return hashlib.sha1("\x00".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def _plan_audio_key(self) -> str:
+        plan = self.model.get_data('current_plan') or ''
+        return hashlib.sha1(plan.encode('utf-8')).hexdigest()
+
+    def _synthesize_plan(self, cancel_event: Optional[threading.Event] = None) -> Optional[List[bytes]]:
+        audio_chunks = []
+        for chunk in iter_chunks([self.model.get_data('current_plan') or ''], TTS_CHUNK_CHARS):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            audio = self.model.generate_tts(chunk)
+            if audio is None:
+                return None
+            audio_chunks.append(audio)
+        return audio_chunks
+
+    def _prefetch_audio(self, plan_key: str, cancel_event: threading.Event) -> None:
+        if cancel_event.is_set():
+            return
+        audio_chunks = self._synthesize_plan(cancel_event)
+        if audio_chunks and not cancel_event.is_set():
+            self.model.set_data('plan_audio', {'key': plan_key, 'chunks': audio_chunks})
+
+    def get_plan_audio(self) -> List[bytes]:
+        """Returns the current plan as text-to-speech audio chunks, using prefetched audio when available"""
+        try:
+            plan_key = self._plan_audio_key()
+            self._pending_prefetch('audio', plan_key)
+
+            cached_audio = self.model.get_data('plan_audio')
+            if cached_audio and cached_audio['key'] == plan_key:
+                return cached_audio['chunks']
+
+            audio_chunks = self._synthesize_plan() or []
+            if audio_chunks:
+                self.model.set_data('plan_audio', {'key': plan_key, 'chunks': audio_chunks})
+            return audio_chunks
+
+        except Exception as e:
+            logger.error(f"Error generating plan audio: {str(e)}")
+            return []
+
+    def _store_plan(self, plan: str, outline: Optional[List[Dict]] = None) -> None:
+        """Stores the plan text together with its day-by-day sections"""
+        structure = self.plan_parser.split_days(plan)
+        with self._plan_lock:
+            self.model.set_data('current_plan', plan)
+            self.model.set_data('plan_preamble', structure['preamble'])
+            self.model.set_data('plan_sections', structure['days'])
+            self.model.set_data('plan_outline', outline)
+            self._plan_day_futures = {}
+
+    def _render_plan_outline(self, outline: List[Dict], days: int, subject: str, learning_style: str) -> str:
+        lines = [f"# 📚 Study Plan - {subject} ({days} days)", "", f"## Learning Style: {learning_style}", ""]
+        for week in outline:
+            lines.append(f"### Week {week.get('week', '')}: {week.get('topic', '')}")
+            lines.extend(f"- {objective}" for objective in week.get('objectives', []))
+            lines.append("")
+        return "\n".join(lines).rstrip()
+
+    def get_plan_day(self, day: int, prefetch: int = PLAN_PREFETCH_DAYS) -> str:
+        """Returns one day of the plan, generating it on first access and prefetching the next days"""
+        try:
+            days = self.model.get_data('days') or 0
+            if not 1 <= day <= days:
+                return f"Error: Day must be between 1 and {days}."
+
+            sections = self.model.get_data('plan_sections') or {}
+            if day in sections:
+                section = sections[day]
+            elif self.model.get_data('plan_outline'):
+                section = self._ensure_plan_day(day).result()
+            else:
+                return f"Error: Day {day} is not available in the current plan."
+
+            for next_day in range(day + 1, min(days, day + prefetch) + 1):
+                self._ensure_plan_day(next_day)
+
+            return section or f"Failed to generate Day {day}. Please try again."
+
+        except Exception as e:
+            logger.error(f"Error in get_plan_day: {str(e)}")
+            return f"Error loading plan day: {str(e)}"
+
+    def _ensure_plan_day(self, day: int) -> Future:
+        """Returns a future for a plan day, scheduling its generation if needed"""
+        with self._plan_lock:
+            sections = self.model.get_data('plan_sections') or {}
+            if day in sections:
+                future = Future()
+                future.set_result(sections[day])
+                return future
+
+            future = self._plan_day_futures.get(day)
+            if future is None:
+                future = _plan_day_executor.submit(self._generate_plan_day, day, self._plan_day_futures)
+                self._plan_day_futures[day] = future
+            return future
+
+    def _generate_plan_day(self, day: int, pending: Dict[int, Future]) -> Optional[str]:
+        try:
+            outline = self.model.get_data('plan_outline') or []
+            if not outline:
+                return None
+
+            week_number = (day - 1) // 7 + 1
+            week_outline = next((week for week in outline if week.get('week') == week_number), outline[-1])
+            quiz_history = self.progress_tracker.quiz_history
+            plan_quiz_start = self.progress_tracker.plan_quiz_start
+            recent_score = quiz_history.mean(plan_quiz_start) if quiz_history.count(plan_quiz_start) else None
+
+            section = self.model.generate_plan_day(
+                day, week_outline, self.model.get_data('days'), self.model.get_data('learning_style'),
+                self.model.get_data('class_standard'), self.model.get_data('subject'), recent_score
+            )
+
+            with self._plan_lock:
+                # Discard results for a plan that was replaced while generating
+                if section and pending is self._plan_day_futures:
+                    sections = self.model.get_data('plan_sections')
+                    sections[day] = section
+                    self.model.set_data('current_plan', self.plan_parser.join_days(
+                        self.model.get_data('plan_preamble', ''), sections
+                    ))
+            return section
+
+        except Exception as e:
+            logger.error(f"Error generating plan day {day}: {str(e)}")
+            return None
+
+        finally:
+            with self._plan_lock:
+                pending.pop(day, None)
+
+    def _current_plan_day(self) -> int:
+        created_date = self.model.get_data('plan_created_date')
+        if not created_date:
+            return 1
+        return (datetime.now() - datetime.fromisoformat(created_date)).days + 1
+
+    def _record_plan_version(self, score: float, previous: Dict[str, Any]) -> None:
+        """Appends a version history entry holding only what the adaptation replaced"""
+        plan_versions = self.model.get_data('plan_versions', [])
+        plan_versions.append({
+            'plan_version': self.model.get_data('plan_version', 1) + 1,
+            'date': datetime.now().isoformat(),
+            'quiz_score': score,
+            **previous
+        })
+        self.model.set_data('plan_versions', plan_versions)
+
+    def _affected_plan_days(self, score: float) -> List[int]:
+        """Already generated days inside the adaptation window for a quiz score"""
+        sections = self.model.get_data('plan_sections') or {}
+        current_day = self._current_plan_day()
+        window = next(size for threshold, size in ADAPTATION_WINDOWS if score >= threshold)
+        return [day for day in range(current_day, current_day + window) if day in sections]
+
+    def _adapt_plan_sections(self, score: float, affected_days: List[int]) -> Optional[str]:
+        """Rewrites the given plan days for a quiz score and patches them in"""
+        sections = self.model.get_data('plan_sections') or {}
+        patch = self.model.adapt_plan_days(
+            score, {day: sections[day] for day in affected_days},
+            self.model.get_data('plan_preamble', '')
+        )
+        if not patch:
+            return None
+
+        with self._plan_lock:
+            previous_sections = {day: sections[day] for day in patch}
+            sections.update(patch)
+            plan = self.plan_parser.join_days(self.model.get_data('plan_preamble', ''), sections)
+            self.model.set_data('plan_sections', sections)
+            self.model.set_data('current_plan', plan)
+
+        self._record_plan_version(score, {'changed_days': sorted(patch), 'previous_sections': previous_sections})
+        return plan
+
+    def _get_quiz_history(self) -> QuizHistory:
+        """Returns the student's quiz history, shared by the model store and the tracker"""
+        quiz_history = self.model.get_data('quiz_history')
+        if not isinstance(quiz_history, QuizHistory):
+            quiz_history = QuizHistory.from_records(quiz_history or [])
+            self.model.set_data('quiz_history', quiz_history)
+        return quiz_history
+
+    def create_class_plans(self, roster: List[Dict[str, Any]], syllabus: str,
+                           max_workers: int = 4) -> List[Dict[str, Any]]:
+        """Generates plans for a whole class roster, one model call per distinct prompt"""
+        results: List[Dict[str, Any]] = []
+        groups: Dict[tuple, List[int]] = {}
+        seen_ids = set()
+
+        # Validate every row up front and group students sharing the same prompt
+        for index, row in enumerate(roster):
+            if not isinstance(row, dict):
+                results.append({'student_id': '', 'status': 'invalid', 'message': "Roster row must be an object"})
+                continue
+
+            student_id = str(row.get('student_id', '')).strip()
+            days = row.get('days')
+            learning_style = row.get('learning_style') or ''
+            class_standard = row.get('class_standard') or 'Grade 8'
+            subject = row.get('subject') or ''
+
+            result = {'student_id': student_id, 'status': 'pending', 'message': ''}
+            results.append(result)
+
+            text_fields = {'learning_style': learning_style, 'class_standard': class_standard, 'subject': subject}
+            wrong_type = [name for name, value in text_fields.items() if not isinstance(value, str)]
+            if wrong_type:
+                result.update(status='invalid', message=f"Fields must be text: {', '.join(wrong_type)}")
+                continue
+
+            if not student_id:
+                result.update(status='invalid', message="Student ID is required")
+                continue
+
+            if student_id in seen_ids:
+                result.update(status='invalid', message="Duplicate student ID in roster")
+                continue
+            seen_ids.add(student_id)
+
+            validation_result = self.validator.validate_plan_inputs(
+                syllabus, days, learning_style, class_standard, subject
+            )
+            if not validation_result['is_valid']:
+                result.update(status='invalid', message=validation_result['message'])
+                continue
+
+            prompt_key = (days, learning_style.strip(), class_standard.strip(), subject.strip())
+            groups.setdefault(prompt_key, []).append(index)
+
+        if not groups:
+            return results
+
+        plans: Dict[tuple, Optional[str]] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+            futures = {
+                executor.submit(self.model.generate_plan, syllabus, days, learning_style,
+                                class_standard, subject): (days, learning_style, class_standard, subject)
+                for days, learning_style, class_standard, subject in groups
+            }
+            for future in as_completed(futures):
+                prompt_key = futures[future]
+                try:
+                    plans[prompt_key] = future.result()
+                except Exception as e:
+                    logger.error(f"Error generating class plan for {prompt_key}: {str(e)}")
+                    plans[prompt_key] = None
+
+        created_date = datetime.now().isoformat()
+        for prompt_key, indices in groups.items():
+            days, learning_style, class_standard, subject = prompt_key
+            plan = plans.get(prompt_key)
+
+            for index in indices:
+                result = results[index]
+                if not plan or plan.startswith("Error:"):
+                    result.update(status='failed',
+                                  message=plan or "Failed to generate study plan. Please try again.")
+                    continue
+
+                try:
+                    student = StudentController(StudentModel())
+                    student.model.set_data('syllabus', syllabus)
+                    student.model.set_data('days', days)
+                    student.model.set_data('learning_style', learning_style)
+                    student.model.set_data('class_standard', class_standard)
+                    student.model.set_data('subject', subject)
+                    student.model.set_data('plan_created_date', created_date)
+                    student._store_plan(plan)
+                    student.progress_tracker.initialize_plan_tracking(days)
+                except Exception as e:
+                    logger.error(f"Error storing class plan for {result['student_id']}: {str(e)}")
+                    result.update(status='failed', message=f"Error creating study plan: {str(e)}")
+                    continue
+
+                self.class_students[result['student_id']] = student
+                result.update(status='created', message="Study plan created", plan=plan)
+
+        logger.info(f"Class plan job finished: {len(roster)} students, {len(groups)} distinct plans generated")
+        return results
+
     def submit_quiz_score(self, score: float, feedback: str = "") -> str:
         """Handles quiz submission and triggers plan adaptation"""
         try:
@@ -63,30 +511,44 @@ class StudentController:
             if not previous_plan:
                 return "Error: No current study plan found to adapt."
 
-            # Record quiz performance
-            quiz_record = {
-                'score': score,
-                'date': datetime.now().isoformat(),
-                'feedback': feedback,
-                'plan_version': self.model.get_data('plan_version', 1)
-            }
-            
-            # Store quiz history
-            quiz_history = self.model.get_data('quiz_history', [])
-            quiz_history.append(quiz_record)
-            self.model.set_data('quiz_history', quiz_history)
+            # Record quiz performance in the shared quiz history
+            self.progress_tracker.record_quiz_performance(
+                score, feedback=feedback, plan_version=self.model.get_data('plan_version', 1)
+            )
 
-            # Generate adapted plan
-            adapted_plan = self.model.adapt_plan(score, previous_plan)
+            # Keep the current plan unchanged rather than replacing it with a fallback
+            if self.model.is_circuit_open():
+                logger.warning("Model circuit open, keeping last known good plan")
+                return previous_plan
+
+            # Patch only the upcoming days; full rewrites are reserved for unstructured plans.
+            # Lazy plans count as day-structured even before any day has been generated.
+            sections = self.model.get_data('plan_sections') or {}
+            if sections or self.model.get_data('plan_outline'):
+                last_day = max(self.model.get_data('days') or 0, max(sections, default=0))
+                if self._current_plan_day() > last_day:
+                    return "Error: No remaining plan days to adapt."
+
+                affected_days = self._affected_plan_days(score)
+                if not affected_days:
+                    # Days generated later already use the recorded score via recent_score
+                    logger.info("Upcoming plan days not generated yet, they will reflect the new score")
+                    return previous_plan
+
+                adapted_plan = self._adapt_plan_sections(score, affected_days)
+                if not adapted_plan:
+                    logger.error("Failed to adapt plan days, keeping current plan")
+                    return "Error: Failed to adapt plan. Please try again."
+            else:
+                adapted_plan = self.model.adapt_plan(score, previous_plan)
+                if adapted_plan:
+                    self._record_plan_version(score, {'changed_days': [], 'previous_plan': previous_plan})
+                    self._store_plan(adapted_plan)
             
             if adapted_plan:
-                self.model.set_data('current_plan', adapted_plan)
                 self.model.set_data('plan_version', self.model.get_data('plan_version', 1) + 1)
                 self.model.set_data('last_adaptation_date', datetime.now().isoformat())
                 
-                # Update progress tracking
-                self.progress_tracker.record_quiz_performance(score)
-                
                 logger.info(f"Plan adapted based on quiz score: {score}%")
                 return adapted_plan
             else:
@@ -97,23 +559,66 @@ class StudentController:
             logger.error(f"Error in submit_quiz_score: {str(e)}")
             return f"Error processing quiz score: {str(e)}"
 
+    def ingest_material(self, file_path: str, kind: str = 'textbook') -> Dict[str, Any]:
+        """Ingests an uploaded textbook or question paper into a chunk store for later prompts"""
+        try:
+            if kind not in ('textbook', 'question_paper'):
+                return {'error': "Material kind must be 'textbook' or 'question_paper'"}
+
+            result = ingest_file(file_path)
+            self.model.set_data(f'{kind}_store', result['store_path'])
+            logger.info(f"Ingested {kind} with {result['chunks']} chunks")
+            return result
+
+        except Exception as e:
+            logger.error(f"Error ingesting material: {str(e)}")
+            return {'error': f"Error ingesting material: {str(e)}"}
+
+    def _read_material(self, kind: str, max_chars: int) -> str:
+        """Reads the leading slice of an ingested material instead of the whole document"""
+        store_path = self.model.get_data(f'{kind}_store')
+        if not store_path:
+            return ""
+        with ChunkStore(store_path) as store:
+            return store.text(max_chars)
+
     def generate_answers(self, question_paper_text: str, textbook_text: str, subject: str) -> str:
         """Generates comprehensive answers with enhanced processing"""
         try:
+            # Ingested materials are already cleaned, so only a slice is read from them
+            if question_paper_text.strip():
+                processed_questions = self.file_processor.clean_text(question_paper_text)
+            else:
+                processed_questions = self._read_material('question_paper', MATERIAL_CONTEXT_CHARS['answers'])
+
             # Validate inputs
-            if not question_paper_text.strip():
+            if not processed_questions:
                 return "Error: No question paper provided."
 
-            # Process and clean the texts
-            processed_questions = self.file_processor.clean_text(question_paper_text)
-            processed_textbook = self.file_processor.clean_text(textbook_text) if textbook_text else ""
+            answers_key = self._request_key(processed_questions, subject)
+            if self.model.is_circuit_open():
+                last_answers = self.model.get_data('last_generated_answers')
+                if last_answers and self.model.get_data('last_generated_answers_key') == answers_key:
+                    logger.warning("Model circuit open, serving last known good answers")
+                    return last_answers
+                return "Error: Answer generation is temporarily unavailable. Please try again later."
+
+            if textbook_text:
+                processed_textbook = self.file_processor.clean_text(textbook_text)
+            else:
+                processed_textbook = self._read_material('textbook', MATERIAL_CONTEXT_CHARS['answers'])
 
             # Generate answers
             answers = self.model.generate_answers(processed_questions, processed_textbook, subject)
+
+            if answers is None:
+                logger.error("Answer generation failed, returning fallback message")
+                return self.model.generate_fallback_answers()
             
             if answers and not answers.startswith("Error:"):
                 # Store the generated answers for reference
                 self.model.set_data('last_generated_answers', answers)
+                self.model.set_data('last_generated_answers_key', answers_key)
                 self.model.set_data('answers_generated_date', datetime.now().isoformat())
                 
                 logger.info(f"Answers generated successfully for {subject}")
@@ -142,6 +647,10 @@ class StudentController:
                         logger.info(f"Using cached YouTube videos for {subject}")
                         return cached_videos
 
+            # Reuse a background prefetch that is already fetching this subject
+            if self._pending_prefetch('videos', subject) and self.model.get_data(cache_key):
+                return self.model.get_data(cache_key)
+
             # Fetch new videos
             videos = self.model.get_youtube_videos(subject, max_results)
             
@@ -164,24 +673,36 @@ class StudentController:
         """Generates a quiz based on study materials"""
         try:
             if not textbook_text.strip():
+                textbook_text = self._read_material('textbook', MATERIAL_CONTEXT_CHARS['quiz'])
+            if not textbook_text:
                 return []
 
             # Process textbook text for quiz generation
             processed_text = self.file_processor.extract_key_concepts(textbook_text)
-            
-            quiz_data = self.model.generate_quiz(processed_text, subject, num_questions)
+            quiz_key = (processed_text, subject, num_questions)
+
+            if self.model.is_circuit_open():
+                last_quiz = self.model.get_data('current_quiz')
+                if last_quiz and last_quiz.get('key') == self._request_key(*quiz_key):
+                    logger.warning("Model circuit open, serving last known good quiz")
+                    return last_quiz['questions']
+                return []
+
+            # Serve a speculatively generated quiz for the same material
+            self._pending_prefetch('quiz', quiz_key)
+            prefetched_quiz = self.model.get_data('prefetched_quiz')
+            if prefetched_quiz and prefetched_quiz['key'] == quiz_key:
+                self.model.set_data('prefetched_quiz', None)
+                quiz_data = prefetched_quiz['questions']
+            else:
+                quiz_data = self.model.generate_quiz(processed_text, subject, num_questions)
+
+            if quiz_data is None:
+                logger.error("Quiz generation failed, returning fallback quiz")
+                return self.model.generate_fallback_quiz(subject)
             
             if quiz_data:
-                # Store quiz for reference
-                quiz_metadata = {
-                    'questions': quiz_data,
-                    'subject': subject,
-                    'created_date': datetime.now().isoformat(),
-                    'num_questions': len(quiz_data)
-                }
-                
-                self.model.set_data('current_quiz', quiz_metadata)
-                logger.info(f"Generated {len(quiz_data)} quiz questions for {subject}")
+                self._store_quiz(quiz_data, quiz_key)
                 
             return quiz_data
             
@@ -189,12 +710,64 @@ class StudentController:
             logger.error(f"Error generating quiz: {str(e)}")
             return []
 
+    def stream_quiz(self, textbook_text: str, subject: str, num_questions: int = 5) -> Iterator[Dict]:
+        """Yields quiz questions as soon as each one arrives from the model"""
+        try:
+            if not textbook_text.strip():
+                textbook_text = self._read_material('textbook', MATERIAL_CONTEXT_CHARS['quiz'])
+            if not textbook_text:
+                return
+
+            processed_text = self.file_processor.extract_key_concepts(textbook_text)
+            quiz_key = (processed_text, subject, num_questions)
+
+            if self.model.is_circuit_open():
+                last_quiz = self.model.get_data('current_quiz')
+                if last_quiz and last_quiz.get('key') == self._request_key(*quiz_key):
+                    logger.warning("Model circuit open, serving last known good quiz")
+                    yield from last_quiz['questions']
+                return
+
+            self._pending_prefetch('quiz', quiz_key)
+            prefetched_quiz = self.model.get_data('prefetched_quiz')
+            if prefetched_quiz and prefetched_quiz['key'] == quiz_key:
+                self.model.set_data('prefetched_quiz', None)
+                self._store_quiz(prefetched_quiz['questions'], quiz_key)
+                yield from prefetched_quiz['questions']
+                return
+
+            quiz_data = []
+            for question in self.model.stream_quiz(processed_text, subject, num_questions):
+                quiz_data.append(question)
+                yield question
+
+            if quiz_data:
+                self._store_quiz(quiz_data, quiz_key)
+            else:
+                logger.error("Quiz streaming failed, returning fallback quiz")
+                yield from self.model.generate_fallback_quiz(subject)
+
+        except Exception as e:
+            logger.error(f"Error streaming quiz: {str(e)}")
+
+    def _store_quiz(self, quiz_data: List[Dict], quiz_key: tuple) -> None:
+        """Stores a generated quiz for reference under the key of the request that produced it"""
+        processed_text, subject, num_questions = quiz_key
+        self.model.set_data('current_quiz', {
+            'questions': quiz_data,
+            'subject': subject,
+            'created_date': datetime.now().isoformat(),
+            'num_questions': len(quiz_data),
+            'key': self._request_key(*quiz_key)
+        })
+        logger.info(f"Generated {len(quiz_data)} quiz questions for {subject}")
+
     def get_study_progress(self) -> Dict[str, Any]:
         """Returns comprehensive study progress information"""
         try:
             progress_data = {
                 'overall_progress': self.progress_tracker.get_overall_progress(),
-                'quiz_history': self.model.get_data('quiz_history', []),
+                'quiz_history': self.progress_tracker.quiz_history.to_list(),
                 'study_streak': self.progress_tracker.get_study_streak(),
                 'plan_creation_date': self.model.get_data('plan_created_date'),
                 'last_study_session': self.progress_tracker.get_last_study_session(),
@@ -225,12 +798,14 @@ class StudentController:
                     'last_adaptation_date': self.model.get_data('last_adaptation_date')
                 },
                 'performance': {
-                    'quiz_history': self.model.get_data('quiz_history', []),
+                    'quiz_history': self.progress_tracker.quiz_history.to_list(),
                     'progress_data': self.get_study_progress()
                 },
                 'materials': {
-                    'textbook_available': bool(self.model.get_data('textbook_text')),
-                    'question_paper_available': bool(self.model.get_data('question_paper_text')),
+                    'textbook_available': bool(self.model.get_data('textbook_text') or
+                                               self.model.get_data('textbook_store')),
+                    'question_paper_available': bool(self.model.get_data('question_paper_text') or
+                                                     self.model.get_data('question_paper_store')),
                     'last_generated_answers': bool(self.model.get_data('last_generated_answers'))
                 },
                 'export_metadata': {
@@ -246,26 +821,146 @@ class StudentController:
             logger.error(f"Error exporting study data: {str(e)}")
             return {}
 
+    def _export_field(self, field: str) -> Any:
+        """Resolves a single export field without rebuilding the full progress report"""
+        quiz_history = self.progress_tracker.quiz_history
+        if field == 'total_quizzes':
+            return len(quiz_history)
+        if field == 'average_score':
+            return quiz_history.mean() if len(quiz_history) else None
+        if field == 'study_streak':
+            return self.progress_tracker.get_study_streak()
+        if field == 'last_study_session':
+            return self.progress_tracker.get_last_study_session()
+        if field == 'overall_progress':
+            return self.progress_tracker.get_overall_progress()
+        if field == 'plan_version':
+            return self.model.get_data('plan_version', 1)
+        return self.model.get_data(field)
+
+    def iter_export_records(self, students: Optional[Dict[str, 'StudentController']] = None,
+                            fields: Optional[Iterable[str]] = None, include_events: bool = True,
+                            cursor: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yields export records student by student, resuming after ``cursor``
+
+        Each student's quiz and plan events come first, followed by the student
+        record carrying the cursor, so a consumer can resume from the cursor of
+        the last student record it stored.
+        """
+        students = students if students is not None else self.class_students
+        fields = tuple(fields) if fields is not None else DEFAULT_EXPORT_FIELDS
+
+        for student_id in sorted(students):
+            if cursor is not None and student_id <= cursor:
+                continue
+
+            student = students[student_id]
+            try:
+                if include_events:
+                    for record in student.progress_tracker.quiz_history:
+                        event = record.to_dict()
+                        event.update(record_type='quiz', student_id=student_id)
+                        yield event
+
+                    for version in student.model.get_data('plan_versions', []):
+                        yield {
+                            'record_type': 'plan_adaptation',
+                            'student_id': student_id,
+                            'plan_version': version['plan_version'],
+                            'date': version['date'],
+                            'quiz_score': version['quiz_score'],
+                            'changed_days': version['changed_days']
+                        }
+
+                    if student.model.get_data('current_plan'):
+                        yield {
+                            'record_type': 'plan_version',
+                            'student_id': student_id,
+                            'plan_version': student.model.get_data('plan_version', 1),
+                            'plan_created_date': student.model.get_data('plan_created_date'),
+                            'last_adaptation_date': student.model.get_data('last_adaptation_date')
+                        }
+
+                record = {'record_type': 'student', 'student_id': student_id}
+                record.update((field, student._export_field(field)) for field in fields)
+                record['cursor'] = student_id
+                yield record
+
+            except Exception as e:
+                logger.error(f"Error exporting study data for {student_id}: {str(e)}")
+                yield {'record_type': 'error', 'student_id': student_id, 'message': str(e)}
+
+    def stream_study_data(self, students: Optional[Dict[str, 'StudentController']] = None,
+                          fields: Optional[Iterable[str]] = None, include_events: bool = True,
+                          cursor: Optional[str] = None, compress: bool = False,
+                          chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Streams study data as NDJSON bytes, optionally gzip-compressed"""
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        buffer = bytearray()
+
+        for record in self.iter_export_records(students, fields, include_events, cursor):
+            buffer += json.dumps(record, default=str).encode('utf-8') + b'\n'
+            if len(buffer) >= chunk_size:
+                data = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+                buffer.clear()
+                if data:
+                    yield data
+
+        data = compressor.compress(bytes(buffer)) + compressor.flush() if compressor else bytes(buffer)
+        if data:
+            yield data
+
+    def get_cohort_analytics(self, students: Optional[Dict[str, 'StudentController']] = None) -> Dict[str, Any]:
+        """Provides per-student and class-level analytics for a whole class in one vectorized pass"""
+        try:
+            students = students if students is not None else self.class_students
+            if self.cohort_analytics is None:
+                from analytics import CohortAnalytics
+                self.cohort_analytics = CohortAnalytics()
+
+            # Only scores recorded since the previous call are folded in
+            self.cohort_analytics.sync({
+                student_id: student.progress_tracker for student_id, student in students.items()
+            })
+
+            return {
+                'class_summary': self.cohort_analytics.class_summary(),
+                'students': self.cohort_analytics.student_metrics()
+            }
+
+        except Exception as e:
+            logger.error(f"Error generating cohort analytics: {str(e)}")
+            return {}
+
+    def get_service_stats(self) -> Dict[str, Any]:
+        """Reports shared cache and model-client health statistics"""
+        return {
+            'syllabus_similarity': self.model.syllabus_index.stats(),
+            'circuit_breaker': self.model.circuit_breaker.stats(),
+            'quiz_generation': self.model.get_quiz_stats(),
+            'hedging': {'enabled': True, **self.model.hedging.stats()} if self.model.hedging else {'enabled': False}
+        }
+
     def get_learning_analytics(self) -> Dict[str, Any]:
         """Provides detailed learning analytics and insights"""
         try:
-            quiz_history = self.model.get_data('quiz_history', [])
+            quiz_history = self.progress_tracker.quiz_history
             
-            if not quiz_history:
+            if not len(quiz_history):
                 return {'message': 'No quiz data available for analytics'}
 
-            scores = [q['score'] for q in quiz_history]
+            scores = quiz_history.scores
             
             analytics = {
                 'performance_metrics': {
-                    'average_score': sum(scores) / len(scores),
-                    'highest_score': max(scores),
-                    'lowest_score': min(scores),
+                    'average_score': quiz_history.mean(),
+                    'highest_score': quiz_history.max(),
+                    'lowest_score': quiz_history.min(),
                     'total_quizzes': len(quiz_history),
                     'improvement_trend': self._calculate_improvement_trend(scores)
                 },
                 'learning_patterns': {
-                    'consistency_score': self._calculate_consistency(scores),
+                    'consistency_score': self._calculate_consistency(quiz_history),
                     'difficulty_areas': self._identify_difficulty_areas(quiz_history),
                     'strength_areas': self._identify_strength_areas(quiz_history)
                 },
@@ -278,7 +973,7 @@ class StudentController:
             logger.error(f"Error generating learning analytics: {str(e)}")
             return {}
 
-    def _calculate_improvement_trend(self, scores: List[float]) -> str:
+    def _calculate_improvement_trend(self, scores: Sequence[float]) -> str:
         """Calculate if the student is improving, declining, or stable"""
         if len(scores) < 2:
             return "insufficient_data"
@@ -299,41 +994,38 @@ class StudentController:
         else:
             return "stable"
 
-    def _calculate_consistency(self, scores: List[float]) -> float:
+    def _calculate_consistency(self, quiz_history: QuizHistory) -> float:
         """Calculate consistency score based on score variance"""
-        if len(scores) < 2:
+        if len(quiz_history) < 2:
             return 0.0
         
-        mean_score = sum(scores) / len(scores)
-        variance = sum((score - mean_score) ** 2 for score in scores) / len(scores)
+        variance = quiz_history.variance()
         
         # Convert to consistency score (lower variance = higher consistency)
         consistency = max(0, 100 - (variance / 10))
         return min(100, consistency)
 
-    def _identify_difficulty_areas(self, quiz_history: List[Dict]) -> List[str]:
+    def _identify_difficulty_areas(self, quiz_history: QuizHistory) -> List[str]:
         """Identify areas where student consistently scores low"""
         # This is a simplified version - in a real app, you'd analyze question types
-        low_score_quizzes = [q for q in quiz_history if q['score'] < 70]
-        if len(low_score_quizzes) > len(quiz_history) * 0.5:
+        if quiz_history.count_below(70) > len(quiz_history) * 0.5:
             return ["fundamental_concepts", "problem_solving"]
         return []
 
-    def _identify_strength_areas(self, quiz_history: List[Dict]) -> List[str]:
+    def _identify_strength_areas(self, quiz_history: QuizHistory) -> List[str]:
         """Identify areas where student consistently performs well"""
-        high_score_quizzes = [q for q in quiz_history if q['score'] >= 80]
-        if len(high_score_quizzes) > len(quiz_history) * 0.7:
+        if quiz_history.count_at_least(80) > len(quiz_history) * 0.7:
             return ["theoretical_understanding", "application"]
         return []
 
-    def _generate_learning_recommendations(self, scores: List[float], quiz_history: List[Dict]) -> List[str]:
+    def _generate_learning_recommendations(self, scores: Sequence[float], quiz_history: QuizHistory) -> List[str]:
         """Generate personalized learning recommendations"""
         recommendations = []
         
-        if not scores:
+        if not len(scores):
             return ["Take more quizzes to get personalized recommendations"]
         
-        avg_score = sum(scores) / len(scores)
+        avg_score = quiz_history.mean()
         
         if avg_score < 60:
             recommendations.extend([
@@ -1,8 +1,7 @@
 import sys
-from diffusers import StableDiffusionPipeline
-import torch
 import os
 from datetime import datetime
+from inference_backend import load_pipeline
 
 # Path to the downloaded model folder
 MODEL_PATH = "./stable-diffusion-v1-4"
@@ -10,16 +9,9 @@ OUTPUT_DIR = "./uploads/theme_images"
 
 # Load the model
 try:
-    # Set the model to a low-level data type for CPU compatibility
-    pipe = StableDiffusionPipeline.from_pretrained(MODEL_PATH, torch_dtype=torch.float32)
-    
-    # Use 'cuda' for GPU or 'cpu' if no GPU
-    if torch.cuda.is_available():
-        pipe = pipe.to("cuda")
-        sys.stderr.write("Model loaded successfully on GPU.\n")
-    else:
-        pipe = pipe.to("cpu")
-        sys.stderr.write("Model loaded successfully on CPU.\n")
+    # float32 for CPU compatibility; the backend comes from INFERENCE_BACKEND
+    pipe = load_pipeline(MODEL_PATH)
+    sys.stderr.write("Model loaded successfully.\n")
         
 except Exception as e:
     sys.stderr.write(f"Error loading model: {e}\n")
@@ -0,0 +1,120 @@
+# inference_backend.py - Pluggable CPU/GPU inference backends for Stable Diffusion
+import os
+import sys
+import shutil
+import torch
+from diffusers import StableDiffusionPipeline
+
+# Backend selection: "torch" (eager), "compile" (torch.compile), "ipex" (Intel
+# Extension for PyTorch) or "onnx" (ONNX Runtime via optimum).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+# Set to "int8" to apply dynamic int8 quantization to the UNet and text encoder
+INFERENCE_QUANTIZE = os.getenv("INFERENCE_QUANTIZE", "").lower()
+
+BACKENDS = ("torch", "compile", "ipex", "onnx")
+
+
+def _quantize_torch(pipe):
+    """Dynamic int8 quantization of the Linear layers (CPU only)."""
+    pipe.unet = torch.ao.quantization.quantize_dynamic(pipe.unet, {torch.nn.Linear}, dtype=torch.qint8)
+    pipe.text_encoder = torch.ao.quantization.quantize_dynamic(
+        pipe.text_encoder, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return pipe
+
+
+def _load_torch(model_path, dtype, device, quantize):
+    pipe = StableDiffusionPipeline.from_pretrained(model_path, torch_dtype=dtype, local_files_only=True)
+    pipe = pipe.to(device)
+    if quantize and device == "cpu":
+        pipe = _quantize_torch(pipe)
+    return pipe
+
+
+def _load_compiled(model_path, dtype, device, quantize):
+    pipe = _load_torch(model_path, dtype, device, quantize)
+    pipe.unet = torch.compile(pipe.unet)
+    pipe.vae.decoder = torch.compile(pipe.vae.decoder)
+    return pipe
+
+
+def _load_ipex(model_path, dtype, device, quantize):
+    import intel_extension_for_pytorch as ipex
+
+    if quantize:
+        print("int8 quantization is not supported with the 'ipex' backend, ignoring.", file=sys.stderr)
+
+    pipe = _load_torch(model_path, dtype, device, quantize=False)
+    pipe.unet = ipex.optimize(pipe.unet.eval(), dtype=dtype, inplace=True)
+    pipe.vae = ipex.optimize(pipe.vae.eval(), dtype=dtype, inplace=True)
+    pipe.text_encoder = ipex.optimize(pipe.text_encoder.eval(), dtype=dtype, inplace=True)
+    return pipe
+
+
+def _export_onnx(model_path, onnx_path):
+    from optimum.onnxruntime import ORTStableDiffusionPipeline
+
+    print(f"Exporting {model_path} to ONNX at {onnx_path}...", file=sys.stderr)
+    pipe = ORTStableDiffusionPipeline.from_pretrained(model_path, export=True)
+    pipe.save_pretrained(onnx_path)
+
+
+def _quantize_onnx(onnx_path, int8_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"Quantizing ONNX models to int8 at {int8_path}...", file=sys.stderr)
+    shutil.copytree(onnx_path, int8_path)
+    for component in ("unet", "text_encoder"):
+        model_file = os.path.join(onnx_path, component, "model.onnx")
+        if os.path.exists(model_file):
+            quantize_dynamic(
+                model_file,
+                os.path.join(int8_path, component, "model.onnx"),
+                weight_type=QuantType.QInt8,
+                use_external_data_format=True,
+            )
+
+
+def _load_onnx(model_path, dtype, device, quantize):
+    from optimum.onnxruntime import ORTStableDiffusionPipeline
+
+    onnx_path = f"{model_path.rstrip('/')}-onnx"
+    if not (os.path.exists(onnx_path) and os.listdir(onnx_path)):
+        _export_onnx(model_path, onnx_path)
+
+    if quantize:
+        int8_path = f"{onnx_path}-int8"
+        if not (os.path.exists(int8_path) and os.listdir(int8_path)):
+            _quantize_onnx(onnx_path, int8_path)
+        onnx_path = int8_path
+
+    provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+    return ORTStableDiffusionPipeline.from_pretrained(onnx_path, provider=provider)
+
+
+_LOADERS = {
+    "torch": _load_torch,
+    "compile": _load_compiled,
+    "ipex": _load_ipex,
+    "onnx": _load_onnx,
+}
+
+
+def load_pipeline(model_path, backend=None, quantize=None, device=None, dtype=None):
+    """Load the Stable Diffusion pipeline on the configured inference backend."""
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if backend not in _LOADERS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Valid options: {', '.join(BACKENDS)}")
+
+    quantize = INFERENCE_QUANTIZE == "int8" if quantize is None else quantize
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    dtype = dtype or torch.float32
+
+    pipe = _LOADERS[backend](model_path, dtype, device, quantize)
+    print(f"Loaded pipeline with '{backend}' backend{' (int8)' if quantize else ''} on {device}.", file=sys.stderr)
+    return pipe
+
+
+def supports_prompt_embeds(pipe):
+    """Whether the pipeline accepts precomputed CLIP embeddings and latents input."""
+    return isinstance(pipe, StableDiffusionPipeline)
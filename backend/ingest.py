@@ -0,0 +1,207 @@
+# ingest.py - Streaming ingestion of uploaded study materials into chunk stores
+import os
+import re
+import mmap
+import struct
+import hashlib
+import logging
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Any
+from utils import FileProcessor
+
+logger = logging.getLogger(__name__)
+
+MATERIALS_DIR = os.getenv("MATERIALS_DIR", "./uploads/materials")
+CHUNK_CHARS = 1000
+# PDFs above these sizes are extracted and cleaned across a process pool
+PARALLEL_PAGE_THRESHOLD = 50
+PARALLEL_BYTES_THRESHOLD = 2 * 1024 * 1024
+PAGES_PER_TASK = 8
+TEXT_PAGE_LINES = 200
+
+_file_processor = FileProcessor()
+
+
+def _clean_page(text: str) -> str:
+    return _file_processor.clean_text(text)
+
+
+class ChunkStore:
+    """Memory-mapped store of cleaned text chunks
+
+    Layout: UTF-8 chunk bytes back to back, then a uint64 offset index with one
+    entry per chunk plus the end offset, then a footer with the chunk count and
+    index position.
+    """
+
+    MAGIC = b'CHNK1'
+    FOOTER = struct.Struct('<5sQQ')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, index_offset = self.FOOTER.unpack_from(self._mmap, len(self._mmap) - self.FOOTER.size)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"Not a chunk store: {path}")
+
+        self._offsets = memoryview(self._mmap)[index_offset:index_offset + (count + 1) * 8].cast('Q')
+        self.count = count
+
+    @classmethod
+    def write(cls, path: str, chunks: Iterable[str]) -> Dict[str, int]:
+        """Write chunks to ``path`` atomically and return size statistics"""
+        offsets = array('Q', [0])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as handle:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                handle.write(data)
+                offsets.append(offsets[-1] + len(data))
+            index_offset = offsets[-1]
+            handle.write(offsets.tobytes())
+            handle.write(cls.FOOTER.pack(cls.MAGIC, len(offsets) - 1, index_offset))
+        os.replace(temp_path, path)
+        return {'chunks': len(offsets) - 1, 'bytes': offsets[-1]}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self._mmap[self._offsets[index]:self._offsets[index + 1]].decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self.count):
+            yield self[index]
+
+    def text(self, max_chars: int, start: int = 0) -> str:
+        """Join chunks from ``start`` until ``max_chars`` characters are collected"""
+        parts = []
+        remaining = max_chars
+        for index in range(start, self.count):
+            if remaining <= 0:
+                break
+            chunk = self[index][:remaining]
+            parts.append(chunk)
+            remaining -= len(chunk) + 1
+        return " ".join(parts)
+
+    def close(self) -> None:
+        if getattr(self, '_offsets', None) is not None:
+            self._offsets.release()
+            self._offsets = None
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> 'ChunkStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _open_pdf(path: str):
+    from pypdf import PdfReader
+    return PdfReader(path)
+
+
+def iter_pages(path: str, reader=None) -> Iterator[str]:
+    """Yield raw page text from an uploaded file, one page at a time"""
+    if path.lower().endswith('.pdf'):
+        for page in (reader or _open_pdf(path)).pages:
+            yield page.extract_text() or ""
+        return
+
+    # Plain text: form feeds mark pages, otherwise emit fixed-size line blocks
+    lines = []
+    with open(path, 'r', encoding='utf-8', errors='ignore') as handle:
+        for line in handle:
+            pages = line.split('\f')
+            for page_end in pages[:-1]:
+                lines.append(page_end)
+                yield "".join(lines)
+                lines = []
+            lines.append(pages[-1])
+            if len(lines) >= TEXT_PAGE_LINES:
+                yield "".join(lines)
+                lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def _extract_clean_range(path: str, start: int, end: int) -> List[str]:
+    """Extract and clean pages ``start`` to ``end`` of a PDF inside a worker process"""
+    pages = _open_pdf(path).pages
+    return [_clean_page(pages[index].extract_text() or "") for index in range(start, end)]
+
+
+def iter_clean_pdf_pages(path: str, page_count: int, workers: int) -> Iterator[str]:
+    """Yield cleaned PDF pages in order, extracting page ranges across ``workers`` processes"""
+    # Keep a bounded window of ranges in flight so memory stays flat
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start in range(0, page_count, PAGES_PER_TASK):
+            end = min(start + PAGES_PER_TASK, page_count)
+            pending.append(executor.submit(_extract_clean_range, path, start, end))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_chunks(pages: Iterable[str], chunk_chars: int = CHUNK_CHARS) -> Iterator[str]:
+    """Re-split cleaned page text into chunks of at most ``chunk_chars`` at sentence or word boundaries"""
+    buffer = ""
+    for page in pages:
+        if not page:
+            continue
+        buffer = f"{buffer} {page}" if buffer else page
+        while len(buffer) > chunk_chars:
+            window = buffer[:chunk_chars]
+            match = None
+            for match in re.finditer(r'[.!?]\s', window):
+                pass
+            cut = match.end() if match else window.rfind(' ') + 1
+            if cut <= 0:
+                cut = chunk_chars
+            yield buffer[:cut].strip()
+            buffer = buffer[cut:].lstrip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _store_path(path: str) -> str:
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return os.path.join(MATERIALS_DIR, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.chunks")
+
+
+def ingest_file(path: str, chunk_chars: int = CHUNK_CHARS, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Extract, clean and chunk an uploaded file into a chunk store, reusing an existing one"""
+    store_path = _store_path(path)
+    if os.path.exists(store_path):
+        with ChunkStore(store_path) as store:
+            return {'store_path': store_path, 'chunks': len(store), 'reused': True}
+
+    # One reader serves both the page count and sequential extraction
+    reader = _open_pdf(path) if path.lower().endswith('.pdf') else None
+    page_count = len(reader.pages) if reader else 0
+    if workers is None:
+        large = page_count > PARALLEL_PAGE_THRESHOLD or os.path.getsize(path) > PARALLEL_BYTES_THRESHOLD
+        workers = min(4, os.cpu_count() or 1) if large else 0
+
+    if reader and workers > 0:
+        pages = iter_clean_pdf_pages(path, page_count, workers)
+    else:
+        pages = (_clean_page(page) for page in iter_pages(path, reader))
+
+    os.makedirs(MATERIALS_DIR, exist_ok=True)
+    stats = ChunkStore.write(store_path, iter_chunks(pages, chunk_chars))
+    logger.info(f"Ingested {path} into {stats['chunks']} chunks ({stats['bytes']} bytes)")
+    return {'store_path': store_path, 'chunks': stats['chunks'], 'reused': False}
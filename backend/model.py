@@ -1,70 +1,270 @@
 # model.py - Enhanced AI Model with better error handling
 import os
-import dotenv
-import vertexai
-from vertexai.generative_models import GenerativeModel
-import googleapiclient.discovery
-import requests
 import base64
-import json
 import logging
 from typing import Dict, List, Optional, Any
 import time
 import re
+import threading
+import copy
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
 from datetime import datetime
+from utils import JSONArrayStreamParser, PlanParser
+from resilience import CircuitBreaker, HedgingPolicy
+from similarity import SyllabusSimilarityIndex
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-dotenv.load_dotenv()
+# SDK clients are created on first use so importing this module stays cheap
+_client_lock = threading.Lock()
+_environment_loaded = False
+_generative_model = None
+_generative_model_initialized = False
+# googleapiclient's HTTP transport is not thread-safe, so clients are kept per thread
+_youtube_clients = threading.local()
 
-# Set credentials
-credentials_path = os.path.join(os.getcwd(), 'agile-ratio-451415-u9-3af22c65bd8d.json')
-if os.path.exists(credentials_path):
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+def _load_environment() -> None:
+    """Loads environment variables and credentials once per process"""
+    global _environment_loaded
+    if _environment_loaded:
+        return
 
-gcp_project_id = os.getenv("GCP_PROJECT_ID", "agile-ratio-451415-u9")
+    import dotenv
+
+    # Load environment variables
+    dotenv.load_dotenv()
+
+    # Set credentials
+    credentials_path = os.path.join(os.getcwd(), 'agile-ratio-451415-u9-3af22c65bd8d.json')
+    if os.path.exists(credentials_path):
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+
+    _environment_loaded = True
+
+
+# Breaker, hedging and reuse settings below may come from .env, so load it first
+_load_environment()
+
+# One breaker per Gemini client, shared by every student's model
+_circuit_breaker = CircuitBreaker(
+    failure_rate_threshold=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+)
+
+
+def get_generative_model():
+    """Initializes Vertex AI on first use and returns the shared Gemini client"""
+    global _generative_model, _generative_model_initialized
+    if _generative_model_initialized:
+        return _generative_model
+
+    with _client_lock:
+        if not _generative_model_initialized:
+            _load_environment()
+            gcp_project_id = os.getenv("GCP_PROJECT_ID", "agile-ratio-451415-u9")
+            try:
+                import vertexai
+                from vertexai.generative_models import GenerativeModel
+
+                vertexai.init(project=gcp_project_id, location="us-central1")
+                _generative_model = GenerativeModel("gemini-2.0-flash-exp")
+                logger.info("Successfully initialized Vertex AI")
+            except Exception as e:
+                logger.error(f"Failed to initialize Vertex AI: {str(e)}")
+                _generative_model = None
+            _generative_model_initialized = True
+
+    return _generative_model
+
+
+def get_youtube_client(api_key: str):
+    """Builds the YouTube Data API client on first use for each key and thread"""
+    clients = getattr(_youtube_clients, 'by_key', None)
+    if clients is None:
+        clients = _youtube_clients.by_key = {}
+
+    client = clients.get(api_key)
+    if client is None:
+        import googleapiclient.discovery
+
+        client = googleapiclient.discovery.build("youtube", "v3", developerKey=api_key)
+        clients[api_key] = client
+    return client
+
+QUIZ_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "options": {"type": "array", "items": {"type": "string"}},
+            "correct": {"type": "string", "enum": ["A", "B", "C", "D"]}
+        },
+        "required": ["question", "options", "correct"]
+    }
+}
+
+PLAN_OUTLINE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "week": {"type": "integer"},
+            "topic": {"type": "string"},
+            "objectives": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["week", "topic", "objectives"]
+    }
+}
+
+# Opt-in request hedging for interactive calls, shared so the budget is global.
+# LLM_HEDGING=1 enables it for every StudentModel.
+_hedging_policy = HedgingPolicy(
+    percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+    max_extra_ratio=float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+)
+# Cross-student reuse of plans and quizzes generated for near-identical materials
+_syllabus_index = SyllabusSimilarityIndex(
+    threshold=float(os.getenv("SYLLABUS_SIMILARITY_THRESHOLD", "0.9"))
+)
+
+# Backup calls only; a hedge is skipped rather than queued when every slot is busy
+_HEDGE_WORKERS = max(1, int(os.getenv("LLM_HEDGE_WORKERS", "4")))
+_hedge_executor = ThreadPoolExecutor(max_workers=_HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+_hedge_slots = threading.BoundedSemaphore(_HEDGE_WORKERS)
+
+
+def _call_in_thread(fn, *args, **kwargs) -> Future:
+    """Runs a call on its own thread so concurrent primary calls never queue behind each other"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='llm-primary', daemon=True).start()
+    return future
 
-try:
-    vertexai.init(project=gcp_project_id, location="us-central1")
-    model = GenerativeModel("gemini-2.0-flash-exp")
-    logger.info("Successfully initialized Vertex AI")
-except Exception as e:
-    logger.error(f"Failed to initialize Vertex AI: {str(e)}")
-    model = None
 
 class StudentModel:
-    def __init__(self):
+    def __init__(self, hedging: Optional[HedgingPolicy] = None):
         self.student_data = {}
-        self.model = model
+        self.hedging = hedging if hedging is not None else (
+            _hedging_policy if os.getenv("LLM_HEDGING") == "1" else None
+        )
+        self._model = None
         self.max_retries = 3
         self.retry_delay = 1
+        self.quiz_stats = {'calls': 0, 'call_failures': 0, 'parse_failures': 0}
+        self.circuit_breaker = _circuit_breaker
+        self.syllabus_index = _syllabus_index
         
+    @property
+    def model(self):
+        """Gemini client, resolved lazily unless one was assigned explicitly"""
+        return self._model if self._model is not None else get_generative_model()
+
+    @model.setter
+    def model(self, value) -> None:
+        self._model = value
+
+    @staticmethod
+    def _material_scope(class_standard: str = '', subject: str = '', learning_style: str = '') -> tuple:
+        return (class_standard.lower().strip(), subject.lower().strip(), learning_style.lower().strip())
+
+    def is_circuit_open(self) -> bool:
+        """Whether calls to the model are currently being rejected to fail fast"""
+        return self.circuit_breaker.state == CircuitBreaker.OPEN
+
     def set_data(self, key: str, value: Any) -> None:
         self.student_data[key] = value
         logger.debug(f"Set data: {key} = {type(value).__name__}")
 
-    def get_data(self, key: str) -> Any:
-        return self.student_data.get(key)
+    def get_data(self, key: str, default: Any = None) -> Any:
+        return self.student_data.get(key, default)
+
+    def _generation_config(self, max_tokens: int, response_schema: Optional[Dict] = None) -> Any:
+        config = {
+            "max_output_tokens": max_tokens,
+            "temperature": 0.7,
+            "top_p": 0.8,
+            "top_k": 40
+        }
+        if not response_schema:
+            return config
+
+        # GenerationConfig converts the OpenAPI-style schema into the SDK's Schema type;
+        # a plain dict would be passed through unconverted
+        from vertexai.generative_models import GenerationConfig
+
+        return GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=response_schema,
+            **config
+        )
+
+    def _generate_content(self, prompt: str, generation_config: Dict[str, Any], hedge: bool = False):
+        """Calls the model, sending a hedged duplicate if the first call is slow
 
-    def _make_api_call_with_retry(self, prompt: str, max_tokens: int = 2048) -> Optional[str]:
+        The losing call cannot be interrupted once running; its result is discarded.
+        """
+        # Only hedge-eligible calls count towards the budget and the latency percentile
+        if not self.hedging or not hedge:
+            return self.model.generate_content(prompt, generation_config=generation_config)
+
+        self.hedging.record_request()
+        start = time.monotonic()
+        client = self.model
+        primary = _call_in_thread(client.generate_content, prompt, generation_config=generation_config)
+        pending = {primary}
+
+        delay = self.hedging.hedge_delay()
+        if delay is not None:
+            done, _ = wait(pending, timeout=delay)
+            if not done and _hedge_slots.acquire(blocking=False):
+                if self.hedging.try_acquire_hedge():
+                    logger.info(f"No response after {delay:.2f}s, sending hedged request")
+                    backup = _hedge_executor.submit(client.generate_content, prompt,
+                                                    generation_config=generation_config)
+                    backup.add_done_callback(lambda _: _hedge_slots.release())
+                    pending.add(backup)
+                else:
+                    _hedge_slots.release()
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self.hedging.record_latency(time.monotonic() - start, hedged_won=future is not primary)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _make_api_call_with_retry(self, prompt: str, max_tokens: int = 2048,
+                                  response_schema: Optional[Dict] = None, hedge: bool = False) -> Optional[str]:
         if not self.model:
             logger.error("Model not initialized")
             return None
             
         for attempt in range(self.max_retries):
+            if not self.circuit_breaker.allow_request():
+                logger.warning("Circuit breaker open, skipping API call")
+                return None
+
             try:
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config={
-                        "max_output_tokens": max_tokens,
-                        "temperature": 0.7,
-                        "top_p": 0.8,
-                        "top_k": 40
-                    }
+                response = self._generate_content(
+                    prompt, self._generation_config(max_tokens, response_schema), hedge=hedge
                 )
+                self.circuit_breaker.record_success()
                 
                 if response and response.text:
                     logger.info(f"API call successful on attempt {attempt + 1}")
@@ -73,6 +273,7 @@ class StudentModel:
                     logger.warning(f"Empty response on attempt {attempt + 1}")
                     
             except Exception as e:
+                self.circuit_breaker.record_failure()
                 logger.error(f"API call failed on attempt {attempt + 1}: {str(e)}")
                 if attempt < self.max_retries - 1:
                     time.sleep(self.retry_delay * (attempt + 1))
@@ -82,7 +283,8 @@ class StudentModel:
         return None
 
     def generate_plan(self, syllabus: str, days: int, learning_style: str, 
-                     class_standard: str = 'Grade 8', subject: str = '') -> str:
+                     class_standard: str = 'Grade 8', subject: str = '') -> Optional[str]:
+        """Returns the generated plan, or None when the model call failed"""
         if not syllabus.strip():
             return "Error: No study content provided. Please upload study materials."
         
@@ -109,10 +311,87 @@ class StudentModel:
         Format with clear headings and bullet points. Make it actionable for {class_standard} students.
         """
         
+        # Only the part of the syllabus that reaches the prompt decides similarity
+        scope = self._material_scope(class_standard, subject, learning_style)
+        signature = self.syllabus_index.signature(syllabus[:2000])
+        cached_plan = self.syllabus_index.lookup(scope, syllabus, f"plan:{days}", signature)
+        if cached_plan:
+            return cached_plan
+
         response = self._make_api_call_with_retry(prompt, max_tokens=3000)
-        return response if response else self._generate_fallback_plan(days, subject, learning_style)
+        if response:
+            self.syllabus_index.store(scope, syllabus, f"plan:{days}", response, signature)
+        return response
+
+    def generate_plan_outline(self, syllabus: str, days: int, learning_style: str,
+                              class_standard: str = 'Grade 8', subject: str = '') -> Optional[List[Dict]]:
+        """Generates a compact week-by-week outline; daily detail is generated on demand"""
+        if not syllabus.strip():
+            return None
+
+        weeks = (days + 6) // 7
+        prompt = f"""
+        You are an expert AI tutor. Outline a {days}-day study plan as {weeks} weeks:
 
-    def _generate_fallback_plan(self, days: int, subject: str, learning_style: str) -> str:
+        **STUDENT PROFILE:**
+        - Education Level: {class_standard}
+        - Subject: {subject}
+        - Learning Style: {learning_style}
+
+        **STUDY MATERIALS:**
+        {syllabus[:2000]}
+
+        For each week give the main topic and 2-4 short learning objectives.
+        Format as JSON: [{{"week": 1, "topic": "...", "objectives": ["...", "..."]}}]
+        """
+
+        scope = self._material_scope(class_standard, subject, learning_style)
+        signature = self.syllabus_index.signature(syllabus[:2000])
+        cached_outline = self.syllabus_index.lookup(scope, syllabus, f"outline:{days}", signature)
+        if cached_outline:
+            return copy.deepcopy(cached_outline)
+
+        response = self._make_api_call_with_retry(prompt, max_tokens=min(3000, 200 + 120 * weeks),
+                                                  response_schema=PLAN_OUTLINE_SCHEMA)
+        if not response:
+            return None
+
+        outline = [week for week in JSONArrayStreamParser().feed(response)
+                   if isinstance(week, dict) and 'topic' in week]
+        if not outline:
+            logger.error("Failed to parse plan outline JSON")
+            return None
+        self.syllabus_index.store(scope, syllabus, f"outline:{days}", copy.deepcopy(outline), signature)
+        return outline
+
+    def generate_plan_day(self, day: int, week_outline: Dict[str, Any], days: int, learning_style: str,
+                          class_standard: str = 'Grade 8', subject: str = '',
+                          recent_score: Optional[float] = None) -> Optional[str]:
+        """Generates the detailed content for a single day of a lazily generated plan"""
+        objectives = "\n".join(f"- {objective}" for objective in week_outline.get('objectives', []))
+        performance = f"Recent quiz average: {recent_score:.0f}%" if recent_score is not None else ""
+
+        prompt = f"""
+        You are an expert AI tutor writing Day {day} of a {days}-day {subject} study plan
+        for a {class_standard} student with a {learning_style} learning style.
+
+        **THIS WEEK:** {week_outline.get('topic', '')}
+        {objectives}
+        {performance}
+
+        Write only Day {day}, starting with a "## Day {day}" heading. Include the learning
+        objective, {learning_style}-specific activities and 2-3 self-assessment questions.
+        """
+
+        response = self._make_api_call_with_retry(prompt, max_tokens=600)
+        if not response:
+            return None
+
+        section = PlanParser().split_days(response)['days'].get(day)
+        return section or f"## Day {day}\n{response.strip()}"
+
+    def generate_fallback_plan(self, days: int, subject: str, learning_style: str) -> str:
+        """Generic plan shown when generation fails; never stored as a real plan"""
         return f"""# 📚 Study Plan - {subject} ({days} days)
 
 ## Learning Style: {learning_style}
@@ -130,7 +409,8 @@ class StudentModel:
 *This is a basic plan. Please try regenerating for a detailed version.*
 """
 
-    def adapt_plan(self, quiz_score: float, previous_plan: str) -> str:
+    def adapt_plan(self, quiz_score: float, previous_plan: str) -> Optional[str]:
+        """Returns the rewritten plan, or None when the model call failed"""
         performance_level = "excellent" if quiz_score >= 90 else "good" if quiz_score >= 80 else "needs improvement"
         
         prompt = f"""
@@ -142,10 +422,44 @@ class StudentModel:
         Provide specific improvements and focus areas.
         """
         
-        response = self._make_api_call_with_retry(prompt, max_tokens=1500)
-        return response if response else f"Score: {quiz_score}%. Focus on weak areas and practice more."
+        return self._make_api_call_with_retry(prompt, max_tokens=1500, hedge=True)
+
+    def adapt_plan_days(self, quiz_score: float, days: Dict[int, str], plan_overview: str = "") -> Optional[Dict[int, str]]:
+        """Rewrites only the given day sections and returns them as a patch"""
+        if not days:
+            return {}
+
+        performance_level = "excellent" if quiz_score >= 90 else "good" if quiz_score >= 80 else "needs improvement"
+        day_numbers = sorted(days)
+        sections = "\n\n".join(days[day] for day in day_numbers)
+
+        prompt = f"""
+        Adapt the upcoming days of a study plan based on quiz performance:
+        
+        **PERFORMANCE:** {quiz_score}% ({performance_level})
+        **PLAN OVERVIEW:** {plan_overview[:500]}
+        **DAYS TO REWRITE:**
+        {sections}
+        
+        Rewrite only Days {", ".join(str(day) for day in day_numbers)}. Start each one with a
+        "## Day N" heading and keep the same day numbers. Do not add other days.
+        """
 
-    def generate_answers(self, question_paper_text: str, textbook_text: str, subject: str) -> str:
+        # Output budget scales with the number of days being rewritten
+        max_tokens = min(3000, 300 + 350 * len(day_numbers))
+        response = self._make_api_call_with_retry(prompt, max_tokens=max_tokens, hedge=True)
+        if not response:
+            return None
+
+        rewritten = PlanParser().split_days(response)['days']
+        patch = {day: text for day, text in rewritten.items() if day in days}
+        if not patch:
+            logger.error("Adapted plan did not contain any of the requested days")
+            return None
+        return patch
+
+    def generate_answers(self, question_paper_text: str, textbook_text: str, subject: str) -> Optional[str]:
+        """Returns the generated answers, or None when the model call failed"""
         if not question_paper_text.strip():
             return "Error: No question paper provided."
         
@@ -158,24 +472,101 @@ class StudentModel:
         Provide detailed, numbered answers with explanations.
         """
         
-        response = self._make_api_call_with_retry(prompt, max_tokens=2500)
-        return response if response else "Unable to generate answers. Please try again."
+        return self._make_api_call_with_retry(prompt, max_tokens=2500, hedge=True)
 
-    def generate_quiz(self, textbook_text: str, subject: str) -> List[Dict]:
-        prompt = f"""
-        Create 5 multiple-choice questions for {subject} based on:
+    def generate_fallback_answers(self) -> str:
+        return "Unable to generate answers. Please try again."
+
+    def _quiz_prompt(self, textbook_text: str, subject: str, num_questions: int) -> str:
+        return f"""
+        Create {num_questions} multiple-choice questions for {subject} based on:
         {textbook_text[:1000]}
         
         Format as JSON: [{{"question": "...", "options": ["A. ...", "B. ...", "C. ...", "D. ..."], "correct": "A"}}]
         """
-        
-        response = self._make_api_call_with_retry(prompt)
-        if response:
-            try:
-                return json.loads(response.strip())
-            except:
-                logger.error("Failed to parse quiz JSON")
-        
+
+    @staticmethod
+    def _is_valid_question(item: Any) -> bool:
+        return (isinstance(item, dict)
+                and isinstance(item.get('question'), str)
+                and isinstance(item.get('options'), list)
+                and isinstance(item.get('correct'), str))
+
+    def stream_quiz(self, textbook_text: str, subject: str, num_questions: int = 5):
+        """Yields quiz questions as soon as each one has streamed in and parsed"""
+        self.quiz_stats['calls'] += 1
+        if not self.model:
+            logger.error("Model not initialized")
+            self.quiz_stats['call_failures'] += 1
+            return
+
+        if not self.circuit_breaker.allow_request():
+            logger.warning("Circuit breaker open, skipping quiz stream")
+            self.quiz_stats['call_failures'] += 1
+            return
+
+        parser = JSONArrayStreamParser()
+        yielded = 0
+        failed = False
+        try:
+            responses = self.model.generate_content(
+                self._quiz_prompt(textbook_text, subject, num_questions),
+                generation_config=self._generation_config(2048, QUIZ_RESPONSE_SCHEMA),
+                stream=True
+            )
+            for chunk in responses:
+                for item in parser.feed(chunk.text or ""):
+                    if self._is_valid_question(item) and yielded < num_questions:
+                        yielded += 1
+                        yield item
+            self.circuit_breaker.record_success()
+        except Exception as e:
+            self.circuit_breaker.record_failure()
+            logger.error(f"Quiz streaming failed: {str(e)}")
+            failed = True
+
+        if failed:
+            self.quiz_stats['call_failures'] += 1
+        elif not yielded:
+            self.quiz_stats['parse_failures'] += 1
+
+    def generate_quiz(self, textbook_text: str, subject: str, num_questions: int = 5) -> Optional[List[Dict]]:
+        """Returns the parsed questions, or None when the call or parsing failed"""
+        # The quiz prompt depends only on the subject and the first 1000 characters
+        scope = self._material_scope(subject=subject)
+        signature = self.syllabus_index.signature(textbook_text[:1000])
+        cached_quiz = self.syllabus_index.lookup(scope, textbook_text, f"quiz:{num_questions}", signature)
+        if cached_quiz:
+            return copy.deepcopy(cached_quiz)
+
+        self.quiz_stats['calls'] += 1
+        response = self._make_api_call_with_retry(
+            self._quiz_prompt(textbook_text, subject, num_questions),
+            response_schema=QUIZ_RESPONSE_SCHEMA
+        )
+        if not response:
+            self.quiz_stats['call_failures'] += 1
+        else:
+            parser = JSONArrayStreamParser()
+            questions = [item for item in parser.feed(response) if self._is_valid_question(item)]
+            if questions:
+                questions = questions[:num_questions]
+                self.syllabus_index.store(scope, textbook_text, f"quiz:{num_questions}",
+                                          copy.deepcopy(questions), signature)
+                return questions
+            self.quiz_stats['parse_failures'] += 1
+            logger.error("Failed to parse quiz JSON")
+        return None
+
+    def get_quiz_stats(self) -> Dict[str, Any]:
+        """Quiz generation attempts with the share that failed or could not be parsed"""
+        stats = dict(self.quiz_stats)
+        calls = stats['calls']
+        stats['call_failure_rate'] = stats['call_failures'] / calls if calls else 0.0
+        stats['parse_failure_rate'] = stats['parse_failures'] / calls if calls else 0.0
+        return stats
+
+    def generate_fallback_quiz(self, subject: str) -> List[Dict]:
         return [{
             "question": f"What is a key concept in {subject}?",
             "options": ["A. Option 1", "B. Option 2", "C. Option 3", "D. Option 4"],
@@ -184,6 +575,8 @@ class StudentModel:
 
     def generate_tts(self, text: str) -> Optional[bytes]:
         try:
+            import requests
+
             url = "https://texttospeech.googleapis.com/v1/text:synthesize"
             data = {
                 "input": {"text": text[:1000]},
@@ -201,11 +594,12 @@ class StudentModel:
 
     def get_youtube_videos(self, subject: str, max_results: int = 5) -> List[Dict]:
         try:
+            _load_environment()
             api_key = os.getenv("YOUTUBE_API_KEY")
             if not api_key:
                 return []
             
-            youtube = googleapiclient.discovery.build("youtube", "v3", developerKey=api_key)
+            youtube = get_youtube_client(api_key)
             request = youtube.search().list(
                 part="snippet",
                 q=f"{subject} tutorial education",
@@ -0,0 +1,148 @@
+# resilience.py - Fault-tolerance helpers for calls to external AI services
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with half-open recovery probes
+
+    Closed: calls pass through and outcomes are recorded in a rolling window.
+    Open: calls are rejected immediately until ``reset_timeout`` has elapsed.
+    Half-open: a limited number of probe calls decide whether to close again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate_threshold: float = 0.5, window_size: int = 20,
+                 min_calls: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.outcomes = deque(maxlen=window_size)
+        self.lock = threading.Lock()
+        self._state = self.CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        # Also re-arms probes whose outcome was never reported
+        if self._state != self.CLOSED and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self.half_open_calls = 0
+            self.opened_at = time.monotonic()
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may proceed; counts as a probe while half-open"""
+        with self.lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self.half_open_calls < self.half_open_max_calls:
+                self.half_open_calls += 1
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self._current_state() == self.HALF_OPEN:
+                logger.info("Circuit breaker closed after successful probe")
+                self._state = self.CLOSED
+                self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def record_failure(self) -> None:
+        with self.lock:
+            state = self._current_state()
+            self.outcomes.append(False)
+            if state == self.HALF_OPEN:
+                self._trip()
+                return
+
+            failures = self.outcomes.count(False)
+            if (state == self.CLOSED and len(self.outcomes) >= self.min_calls
+                    and failures / len(self.outcomes) >= self.failure_rate_threshold):
+                self._trip()
+
+    def _trip(self) -> None:
+        logger.warning(f"Circuit breaker opened for {self.reset_timeout}s")
+        self._state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'state': self._current_state(),
+                'window_calls': len(self.outcomes),
+                'window_failures': self.outcomes.count(False),
+                'rejected_calls': self.rejected_calls
+            }
+
+
+class HedgingPolicy:
+    """Decides when to send a backup request for a slow call, within an extra-call budget
+
+    The hedge delay is the configured percentile of recently observed latencies.
+    No hedging happens until ``min_samples`` latencies have been recorded.
+    """
+
+    def __init__(self, percentile: float = 0.95, max_extra_ratio: float = 0.05,
+                 window_size: int = 200, min_samples: int = 20):
+        self.percentile = percentile
+        self.max_extra_ratio = max_extra_ratio
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window_size)
+        self.lock = threading.Lock()
+        self.total_requests = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+
+    def record_request(self) -> None:
+        with self.lock:
+            self.total_requests += 1
+
+    def record_latency(self, seconds: float, hedged_won: bool = False) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+            if hedged_won:
+                self.hedge_wins += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait for the first response before hedging, or None to not hedge"""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def try_acquire_hedge(self) -> bool:
+        """Reserve one extra call if that keeps hedges within the budget"""
+        with self.lock:
+            if self.hedged_requests + 1 > self.total_requests * self.max_extra_ratio:
+                return False
+            self.hedged_requests += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'total_requests': self.total_requests,
+                'hedged_requests': self.hedged_requests,
+                'hedge_wins': self.hedge_wins,
+                'extra_call_ratio': self.hedged_requests / self.total_requests if self.total_requests else 0.0
+            }
@@ -0,0 +1,132 @@
+# similarity.py - Near-duplicate detection of study materials for prompt result reuse
+import threading
+import zlib
+import random
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+from utils import FileProcessor
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+class SyllabusSimilarityIndex:
+    """MinHash/LSH index that reuses results generated for near-identical materials
+
+    Results are only reused within the same scope (for example class standard,
+    subject and learning style) and for the same kind of request.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, max_entries: int = 1000):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.file_processor = FileProcessor()
+
+        # Fixed seed so signatures are comparable across processes
+        rng = random.Random(1)
+        self.permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.buckets: Dict[Tuple, List[int]] = {}
+        self.next_id = 0
+        self.lookups = 0
+        self.hits = 0
+
+    def _shingles(self, text: str) -> set:
+        words = self.file_processor.clean_text(text).lower().split()
+        if len(words) <= self.shingle_size:
+            return {zlib.crc32(" ".join(words).encode('utf-8'))}
+        return {
+            zlib.crc32(" ".join(words[index:index + self.shingle_size]).encode('utf-8'))
+            for index in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        shingles = self._shingles(text)
+        return tuple(
+            min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles)
+            for a, b in self.permutations
+        )
+
+    def _band_keys(self, scope: Tuple, signature: Tuple[int, ...]) -> List[Tuple]:
+        return [(scope, band, signature[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)]
+
+    def _similarity(self, first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        return sum(1 for a, b in zip(first, second) if a == b) / self.num_perm
+
+    def lookup(self, scope: Tuple, text: str, kind: str,
+               signature: Optional[Tuple[int, ...]] = None) -> Optional[Any]:
+        """Return a cached result for near-identical material in the same scope, if any"""
+        signature = signature or self.signature(text)
+        with self.lock:
+            self.lookups += 1
+            best_id, best_score = None, 0.0
+            candidates = {entry_id for key in self._band_keys(scope, signature)
+                          for entry_id in self.buckets.get(key, ())}
+            for entry_id in candidates:
+                entry = self.entries[entry_id]
+                if kind not in entry['results']:
+                    continue
+                score = self._similarity(signature, entry['signature'])
+                if score >= self.threshold and score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(best_id)
+            logger.info(f"Reusing {kind} result for near-duplicate material (similarity {best_score:.2f})")
+            return self.entries[best_id]['results'][kind]
+
+    def store(self, scope: Tuple, text: str, kind: str, result: Any,
+              signature: Optional[Tuple[int, ...]] = None) -> None:
+        """Remember a result generated for the given material"""
+        signature = signature or self.signature(text)
+        with self.lock:
+            # Attach to an identical signature in the same scope instead of duplicating it
+            for entry_id in self.buckets.get(self._band_keys(scope, signature)[0], ()):
+                entry = self.entries[entry_id]
+                if entry['signature'] == signature:
+                    entry['results'][kind] = result
+                    self.entries.move_to_end(entry_id)
+                    return
+
+            entry_id = self.next_id
+            self.next_id += 1
+            band_keys = self._band_keys(scope, signature)
+            self.entries[entry_id] = {'signature': signature, 'band_keys': band_keys, 'results': {kind: result}}
+            for key in band_keys:
+                self.buckets.setdefault(key, []).append(entry_id)
+
+            while len(self.entries) > self.max_entries:
+                evicted_id, evicted = self.entries.popitem(last=False)
+                for key in evicted['band_keys']:
+                    bucket = self.buckets.get(key, [])
+                    bucket.remove(evicted_id)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'misses': self.lookups - self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'threshold': self.threshold
+            }
@@ -2,7 +2,10 @@
 import re
 import logging
 from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+from datetime import datetime
+from array import array
+import bisect
+import math
 import json
 
 logger = logging.getLogger(__name__)
@@ -86,6 +89,109 @@ class FileProcessor:
             return "Error extracting key concepts from text"
 
 
+class PlanParser:
+    """Splits study plans into day-by-day sections and reassembles them"""
+
+    # Matches headings such as "## Day 3", "**Day 3:**" or "Day 3 - Fractions"
+    DAY_HEADING = re.compile(r'^[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*)?[ \t]*Day[ \t]+(\d+)\b',
+                             re.IGNORECASE | re.MULTILINE)
+
+    def split_days(self, plan: str) -> Dict[str, Any]:
+        """Return the plan preamble and a mapping of day number to section text"""
+        if not plan:
+            return {'preamble': "", 'days': {}}
+
+        matches = list(self.DAY_HEADING.finditer(plan))
+        if not matches:
+            return {'preamble': plan, 'days': {}}
+
+        days: Dict[int, str] = {}
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(plan)
+            day = int(match.group(1))
+            section = plan[match.start():end].strip('\n')
+            # Repeated headings for the same day are folded into one section
+            days[day] = f"{days[day]}\n{section}" if day in days else section
+
+        return {'preamble': plan[:matches[0].start()].rstrip('\n'), 'days': days}
+
+    def join_days(self, preamble: str, days: Dict[int, str]) -> str:
+        """Reassemble a plan from its preamble and day sections"""
+        parts = [preamble] if preamble else []
+        parts.extend(days[day] for day in sorted(days))
+        return "\n\n".join(parts)
+
+
+class JSONArrayStreamParser:
+    """Incrementally extracts objects from a JSON array embedded in noisy text
+
+    Text can be fed in chunks as it streams from the model. Markdown fences and
+    prose around the array are skipped, and each complete object is returned as
+    soon as it parses.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.in_array = False
+        self.started = False
+        self.finished = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add text and return any objects completed by it"""
+        if self.finished or not chunk:
+            return []
+
+        self.buffer += chunk
+        items = []
+
+        while not self.finished:
+            if not self.in_array:
+                start = self.buffer.find('[', self.position)
+                if start == -1:
+                    self.position = len(self.buffer)
+                    break
+                self.position = start + 1
+                self.in_array = True
+
+            # Skip separators between array elements
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n,':
+                self.position += 1
+            if self.position >= len(self.buffer):
+                break
+
+            if self.buffer[self.position] == ']':
+                if self.started:
+                    self.finished = True
+                    break
+                # Empty brackets in surrounding prose, keep looking
+                self.in_array = False
+                continue
+
+            if not self.started and self.buffer[self.position] not in '{[':
+                # A bracket in prose rather than the start of the array
+                self.in_array = False
+                continue
+
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # Incomplete element; wait for more text
+                break
+
+            items.append(item)
+            self.started = True
+            self.position = end
+
+        # Drop consumed text so the buffer stays bounded by one element
+        if self.position:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+
+        return items
+
+
 class DataValidator:
     """Handles input validation for the application"""
 
@@ -149,12 +255,187 @@ class DataValidator:
         }
 
 
+class QuizRecord:
+    """Read-only view of a single quiz history entry"""
+
+    __slots__ = ('score', 'timestamp', 'feedback', 'plan_version')
+
+    def __init__(self, score: float, timestamp: float, feedback: str, plan_version: int):
+        self.score = score
+        self.timestamp = timestamp
+        self.feedback = feedback
+        self.plan_version = plan_version
+
+    @property
+    def date(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'score': self.score,
+            'date': self.date.isoformat(),
+            'feedback': self.feedback,
+            'plan_version': self.plan_version
+        }
+
+
+class QuizHistory:
+    """Compact quiz history backed by typed arrays with running aggregates"""
+
+    def __init__(self):
+        self.scores = array('d')
+        self.timestamps = array('d')
+        self.plan_versions = array('l')
+        self.feedback: List[str] = []
+        # Prefix sums let any window [start:] report mean/variance in O(1)
+        self._prefix_sum = array('d', [0.0])
+        self._prefix_sq = array('d', [0.0])
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'QuizHistory':
+        """Build a history from legacy list-of-dict quiz records"""
+        history = cls()
+        for record in records:
+            date = record.get('date')
+            if isinstance(date, str):
+                date = datetime.fromisoformat(date)
+            history.append(
+                record['score'],
+                feedback=record.get('feedback', ''),
+                plan_version=record.get('plan_version', 1),
+                timestamp=date.timestamp() if date else None
+            )
+        return history
+
+    def append(self, score: float, feedback: str = "", plan_version: int = 1,
+               timestamp: Optional[float] = None) -> None:
+        score = float(score)
+        self.scores.append(score)
+        self.timestamps.append(timestamp if timestamp is not None else datetime.now().timestamp())
+        self.plan_versions.append(plan_version or 1)
+        self.feedback.append(feedback or "")
+        self._prefix_sum.append(self._prefix_sum[-1] + score)
+        self._prefix_sq.append(self._prefix_sq[-1] + score * score)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __getitem__(self, index: int) -> QuizRecord:
+        return QuizRecord(self.scores[index], self.timestamps[index],
+                          self.feedback[index], self.plan_versions[index])
+
+    def __iter__(self):
+        for index in range(len(self.scores)):
+            yield self[index]
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [record.to_dict() for record in self]
+
+    def window(self, start: int = 0) -> memoryview:
+        """Zero-copy view over the scores recorded from ``start`` onwards"""
+        return memoryview(self.scores)[start:]
+
+    def count(self, start: int = 0) -> int:
+        return max(0, len(self.scores) - start)
+
+    def mean(self, start: int = 0) -> float:
+        n = self.count(start)
+        if n == 0:
+            return 0.0
+        return (self._prefix_sum[-1] - self._prefix_sum[start]) / n
+
+    def variance(self, start: int = 0) -> float:
+        n = self.count(start)
+        if n == 0:
+            return 0.0
+        mean = self.mean(start)
+        sum_sq = self._prefix_sq[-1] - self._prefix_sq[start]
+        return max(0.0, sum_sq / n - mean * mean)
+
+    def min(self, start: int = 0) -> float:
+        return min(self.window(start)) if self.count(start) else 0.0
+
+    def max(self, start: int = 0) -> float:
+        return max(self.window(start)) if self.count(start) else 0.0
+
+    def count_below(self, threshold: float, start: int = 0) -> int:
+        return sum(map(float(threshold).__gt__, self.window(start)))
+
+    def count_at_least(self, threshold: float, start: int = 0) -> int:
+        return sum(map(float(threshold).__le__, self.window(start)))
+
+
+class SessionHistory:
+    """Compact study session log with an incrementally maintained calendar index"""
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.scores = array('d')
+        self.kinds: List[str] = []
+        # Calendar index: sorted distinct study-day ordinals, the run of
+        # consecutive days ending at the latest one, and the latest timestamp
+        self.study_days = array('l')
+        self.last_day_run = 0
+        self.last_timestamp: Optional[float] = None
+
+    def append(self, kind: str, score: Optional[float] = None,
+               timestamp: Optional[float] = None) -> None:
+        if timestamp is None:
+            timestamp = datetime.now().timestamp()
+        self.timestamps.append(timestamp)
+        self.scores.append(math.nan if score is None else float(score))
+        self.kinds.append(kind)
+        self._index_session(timestamp)
+
+    def _index_session(self, timestamp: float) -> None:
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+        day = datetime.fromtimestamp(timestamp).toordinal()
+        position = bisect.bisect_left(self.study_days, day)
+        if position < len(self.study_days) and self.study_days[position] == day:
+            return
+
+        self.study_days.insert(position, day)
+        if position < len(self.study_days) - 1:
+            # Back-filled day: only the run ending at the latest day can change
+            self._recount_last_day_run()
+        elif len(self.study_days) > 1 and self.study_days[-2] == day - 1:
+            self.last_day_run += 1
+        else:
+            self.last_day_run = 1
+
+    def _recount_last_day_run(self) -> None:
+        run = 1
+        index = len(self.study_days) - 1
+        while index > 0 and self.study_days[index - 1] == self.study_days[index] - 1:
+            run += 1
+            index -= 1
+        self.last_day_run = run
+
+    def streak(self, today: Optional[int] = None) -> int:
+        """Consecutive study days ending today or yesterday"""
+        if not self.study_days:
+            return 0
+        today = today if today is not None else datetime.now().date().toordinal()
+        return self.last_day_run if today - self.study_days[-1] <= 1 else 0
+
+    def days_active(self, start_day: int, end_day: int) -> int:
+        """Number of distinct study days in the inclusive ordinal range"""
+        return (bisect.bisect_right(self.study_days, end_day)
+                - bisect.bisect_left(self.study_days, start_day))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
 class ProgressTracker:
     """Tracks student progress and study patterns"""
 
-    def __init__(self):
-        self.study_sessions = []
-        self.quiz_scores = []
+    def __init__(self, quiz_history: Optional[QuizHistory] = None):
+        self.quiz_history = quiz_history if quiz_history is not None else QuizHistory()
+        self.plan_quiz_start = len(self.quiz_history)
+        self.study_sessions = SessionHistory()
         self.topics_covered = []
         self.plan_start_date = None
         self.total_days = 0
@@ -164,29 +445,22 @@ class ProgressTracker:
         try:
             self.plan_start_date = datetime.now()
             self.total_days = days
-            self.study_sessions = []
-            self.quiz_scores = []
+            self.study_sessions = SessionHistory()
+            # Quiz history is shared with the controller, so only move the plan window
+            self.plan_quiz_start = len(self.quiz_history)
             self.topics_covered = []
 
             logger.info(f"Initialized progress tracking for {days}-day plan")
         except Exception as e:
             logger.error(f"Error initializing plan tracking: {str(e)}")
 
-    def record_quiz_performance(self, score: float) -> None:
+    def record_quiz_performance(self, score: float, feedback: str = "", plan_version: int = 1) -> None:
         """Record a quiz score and update tracking"""
         try:
-            quiz_record = {
-                'score': score,
-                'date': datetime.now(),
-                'day': len(self.quiz_scores) + 1
-            }
-
-            self.quiz_scores.append(quiz_record)
-            self.study_sessions.append({
-                'date': datetime.now(),
-                'type': 'quiz',
-                'score': score
-            })
+            timestamp = datetime.now().timestamp()
+            self.quiz_history.append(score, feedback=feedback, plan_version=plan_version,
+                                     timestamp=timestamp)
+            self.study_sessions.append('quiz', score=score, timestamp=timestamp)
 
             logger.debug(f"Recorded quiz score: {score}%")
         except Exception as e:
@@ -202,8 +476,8 @@ class ProgressTracker:
             planned_progress = min(100.0, (days_elapsed / self.total_days) * 100)
 
             # Adjust based on quiz performance
-            if self.quiz_scores:
-                avg_score = sum(q['score'] for q in self.quiz_scores) / len(self.quiz_scores)
+            if self.quiz_history.count(self.plan_quiz_start):
+                avg_score = self.quiz_history.mean(self.plan_quiz_start)
                 performance_factor = avg_score / 100.0
                 actual_progress = planned_progress * performance_factor
             else:
@@ -218,28 +492,7 @@ class ProgressTracker:
     def get_study_streak(self) -> int:
         """Calculate current study streak in days"""
         try:
-            if not self.study_sessions:
-                return 0
-
-            # Sort sessions by date
-            sorted_sessions = sorted(self.study_sessions, key=lambda x: x['date'], reverse=True)
-
-            streak = 0
-            check_date = datetime.now().date()
-
-            for session in sorted_sessions:
-                session_date = session['date'].date()
-
-                if session_date == check_date:
-                    streak += 1
-                    check_date -= timedelta(days=1)
-                elif session_date == check_date - timedelta(days=1):
-                    streak += 1
-                    check_date = session_date
-                else:
-                    break
-
-            return streak
+            return self.study_sessions.streak()
 
         except Exception as e:
             logger.error(f"Error calculating study streak: {str(e)}")
@@ -248,26 +501,36 @@ class ProgressTracker:
     def get_last_study_session(self) -> Optional[str]:
         """Get the date of the last study session"""
         try:
-            if not self.study_sessions:
+            last_timestamp = self.study_sessions.last_timestamp
+            if last_timestamp is None:
                 return None
 
-            last_session = max(self.study_sessions, key=lambda x: x['date'])
-            return last_session['date'].isoformat()
+            return datetime.fromtimestamp(last_timestamp).isoformat()
 
         except Exception as e:
             logger.error(f"Error getting last study session: {str(e)}")
             return None
 
+    def get_days_active(self, start_date: datetime, end_date: Optional[datetime] = None) -> int:
+        """Count distinct days with at least one study session in a date range"""
+        try:
+            end_date = end_date or datetime.now()
+            return self.study_sessions.days_active(start_date.toordinal(), end_date.toordinal())
+
+        except Exception as e:
+            logger.error(f"Error counting active study days: {str(e)}")
+            return 0
+
     def get_topics_covered(self) -> List[str]:
         """Get list of topics covered so far"""
         try:
             # This is a simplified version - in a real app, topics would be tracked separately
-            if not self.quiz_scores:
+            if not self.quiz_history.count(self.plan_quiz_start):
                 return []
 
             # Generate mock topics based on quiz performance
             topics = []
-            avg_score = sum(q['score'] for q in self.quiz_scores) / len(self.quiz_scores)
+            avg_score = self.quiz_history.mean(self.plan_quiz_start)
 
             if avg_score >= 80:
                 topics.extend(["Advanced Concepts", "Problem Solving", "Critical Thinking"])
@@ -287,11 +550,11 @@ class ProgressTracker:
         try:
             recommendations = []
 
-            if not self.quiz_scores:
+            if not self.quiz_history.count(self.plan_quiz_start):
                 recommendations.append("Take your first quiz to get personalized recommendations")
                 return recommendations
 
-            avg_score = sum(q['score'] for q in self.quiz_scores) / len(self.quiz_scores)
+            avg_score = self.quiz_history.mean(self.plan_quiz_start)
             streak = self.get_study_streak()
 
             if avg_score < 60: